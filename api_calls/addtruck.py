@@ -1,3 +1,5 @@
+import argparse
+import csv
 import boto3
 import requests
 import json
@@ -15,6 +17,33 @@ def make_api_request(url, token, payload):
     response = requests.post(url, headers=headers, data=json.dumps(payload))
     return response.json()
 
+
+# most trucks accepted by one POST /addtrucks request
+MAX_TRUCKS_PER_REQUEST = 500
+
+
+def read_trucks(path):
+    """Trucks of a JSON array file, or of a CSV file with a header row of the truck attributes."""
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            return [{name: value for name, value in row.items() if value} for row in csv.DictReader(f)]
+        return json.load(f)
+
+
+def add_trucks(url, token, trucks):
+    """Register the trucks in batches and print the result of every truck."""
+    for start in range(0, len(trucks), MAX_TRUCKS_PER_REQUEST):
+        batch = trucks[start:start + MAX_TRUCKS_PER_REQUEST]
+        response = make_api_request(url, token, batch)
+        print(response.get('message'))
+        for result in response.get('results', []):
+            print(f"{result['currentVin']}: {result['status']}")
+
+
+parser = argparse.ArgumentParser(description="Add a truck configuration, or every truck of a file.")
+parser.add_argument("--file", help="JSON array or CSV file of trucks to add with POST /addtrucks")
+args = parser.parse_args()
+
 # User credentials
 username = vr.username
 password = vr.password
@@ -25,6 +54,7 @@ app_client_id = vr.user_pool_client_id
 
 # API Gateway endpoint
 api_url = f"{vr.api_url}/addtruck"
+bulk_api_url = f"{vr.api_url}/addtrucks"
 
 # Item payload
 item_payload = {
@@ -48,8 +78,11 @@ item_payload = {
 # Authenticate user and get the JWT token
 token = authenticate_user(username, password, user_pool_id=user_pool_id, app_client_id=app_client_id)
 
-# Make the API request
-response = make_api_request(api_url, token, item_payload)
+if args.file:
+    add_trucks(bulk_api_url, token, read_trucks(args.file))
+else:
+    # Make the API request
+    response = make_api_request(api_url, token, item_payload)
 
-# Print the response
-print(response)
+    # Print the response
+    print(response)
@@ -1,18 +1,41 @@
+import argparse
 import boto3
 import requests
 import variables as vr
 
 from authenticate import authenticate_user
 
-def make_api_request(url, token):
+def make_api_request(url, token, params=None):
     headers = {
         'Authorization': token,
         'Content-Type': 'application/json'
     }
 
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=headers, params=params)
     return response.json()
 
+
+def get_all_pages(url, token, params=None, limit=100):
+    """Follow the cursor of every page until the last one."""
+    items = []
+    params = dict(params or {}, limit=limit)
+
+    while True:
+        page = make_api_request(url, token, params)
+        items.extend(page['items'])
+        print(f"Fetched {len(page['items'])} records, {len(items)} so far")
+
+        if not page.get('cursor'):
+            return items
+        params['cursor'] = page['cursor']
+
+
+parser = argparse.ArgumentParser(description="List all records.")
+parser.add_argument("--fields", help="comma separated attributes to return, e.g. filename,date,map")
+args = parser.parse_args()
+
+params = {'fields': args.fields} if args.fields else {}
+
 # User credentials
 username = vr.username
 password = vr.password
@@ -27,8 +50,8 @@ api_url = f"{vr.api_url}/allrecords"
 # Authenticate user and get the JWT token
 token = authenticate_user(username, password, user_pool_id=user_pool_id, app_client_id=app_client_id)
 
-# Make the API request
-response = make_api_request(api_url, token)
+# Make the API requests
+response = get_all_pages(api_url, token, params)
 
 # Print the response
 print(response)
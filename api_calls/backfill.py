@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+import variables as vr
+
+# Share the filename validation and record building with CsvLambda
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'csv_lambda'))
+from records import InvalidKey, parse_key, build_record, batch_get, batch_write
+
+CSV_SUFFIX = '_PQR.csv'
+
+# Object keys start with the VIN (E9xxxx), so one worker per third character
+DEFAULT_PREFIXES = [f"E9{digit}" for digit in range(10)]
+
+
+class Checkpoint:
+    """Last processed object key per prefix, saved after every listed page."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.keys = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.keys = json.load(f)
+
+    def get(self, prefix):
+        return self.keys.get(prefix)
+
+    def save(self, prefix, key):
+        with self.lock:
+            self.keys[prefix] = key
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.keys, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.counts = {'listed': 0, 'created': 0, 'exists': 0, 'invalid': 0, 'failed': 0}
+
+    def add(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                self.counts[name] += count
+
+    def report(self):
+        elapsed = time.monotonic() - self.start
+        with self.lock:
+            counts = dict(self.counts)
+        rate = counts['listed'] / elapsed if elapsed else 0.0
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        print(f"[{elapsed:.0f}s] {summary} ({rate:.1f} objects/s)")
+
+
+def ingest_page(dynamodb, keys, trucks, stats):
+    """
+    Create the missing records of a page of CSV keys. Returns the keys that
+    could not be ingested, whose record or truck placeholder was not written.
+    """
+    files = {}
+    for key in keys:
+        try:
+            files[key] = parse_key(key)
+        except InvalidKey as e:
+            print(f"{e}: {key}")
+            stats.add(invalid=1)
+
+    if not files:
+        return set()
+
+    vins = {vin for vin, _, _ in files.values()}
+    unknown_vins = vins - trucks.keys()
+
+    found = batch_get(dynamodb, {
+        vr.trucks_table_name: [{'currentVin': vin} for vin in unknown_vins],
+        vr.records_table_name: [{'filename': key} for key in files],
+    })
+
+    for item in found[vr.trucks_table_name]:
+        trucks[item['currentVin']] = item
+    existing = {item['filename'] for item in found[vr.records_table_name]}
+
+    placeholders = {vin: {'currentVin': vin} for vin in sorted(vins - trucks.keys())}
+    failed_vins = set()
+    if placeholders:
+        print(f"No record for {list(placeholders)} in the {vr.trucks_table_name}, creating.")
+        failed_vins = {item['currentVin'] for item in batch_write(dynamodb, vr.trucks_table_name, list(placeholders.values()))}
+        for vin, item in placeholders.items():
+            if vin in failed_vins:
+                print(f"Could not create truck {vin}.")
+            else:
+                trucks[vin] = item
+
+    new_records = [
+        build_record(trucks.get(vin) or placeholders[vin], key, date_obj, mf4_filename)
+        for key, (vin, date_obj, mf4_filename) in files.items()
+        if key not in existing
+    ]
+
+    failed_records = {item['filename'] for item in batch_write(dynamodb, vr.records_table_name, new_records)}
+    for key in sorted(failed_records):
+        print(f"Could not create record {key}.")
+
+    stats.add(exists=len(existing), created=len(new_records) - len(failed_records), failed=len(failed_records))
+
+    # the files of a truck that was not created are ingested again, which retries the truck
+    return failed_records | {key for key, (vin, _, _) in files.items() if vin in failed_vins}
+
+
+def backfill_prefix(prefix, checkpoint, trucks, stats):
+    # boto3 sessions and resources are not thread safe, so every worker gets its own
+    session = boto3.session.Session(region_name=vr.region)
+    s3 = session.client('s3')
+    dynamodb = session.resource('dynamodb')
+
+    params = {'Bucket': vr.csv_bucket_name, 'Prefix': prefix}
+    start_after = checkpoint.get(prefix)
+    if start_after:
+        print(f"Resuming {prefix} after {start_after}")
+        params['StartAfter'] = start_after
+
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**params):
+        keys = [obj['Key'] for obj in page.get('Contents', [])]
+        if not keys:
+            continue
+
+        stats.add(listed=len(keys))
+        failed = ingest_page(dynamodb, [key for key in keys if key.endswith(CSV_SUFFIX)], trucks, stats)
+        stats.report()
+
+        if failed:
+            # keep the checkpoint before the first failed key, so a rerun starts with it
+            first = min(keys.index(key) for key in failed)
+            if first:
+                checkpoint.save(prefix, keys[first - 1])
+            raise RuntimeError(f"{len(failed)} files of {prefix} could not be ingested, "
+                               f"stopped before {keys[first]}. Run the backfill again to retry them.")
+
+        checkpoint.save(prefix, keys[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create missing RecordsTable items for the CSV files already in the bucket.")
+    parser.add_argument("--prefix", action="append", dest="prefixes",
+                        help="key prefix to backfill, can be repeated (default: E90 ... E99)")
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent prefix workers")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json",
+                        help="file that records progress so an interrupted run can resume")
+    args = parser.parse_args()
+
+    prefixes = args.prefixes or DEFAULT_PREFIXES
+    checkpoint = Checkpoint(args.checkpoint)
+    stats = Stats()
+
+    # Truck items shared by all workers, a VIN is read from TrucksTable once per run
+    trucks = {}
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(backfill_prefix, prefix, checkpoint, trucks, stats): prefix for prefix in prefixes}
+        for future, prefix in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Backfill of {prefix} failed: {e}")
+
+    stats.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import gzip
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+
+import variables as vr
+
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.counts = {'items': 0, 'parts': 0, 'bytes': 0}
+
+    def add(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                self.counts[name] += count
+
+    def report(self):
+        elapsed = time.monotonic() - self.start
+        with self.lock:
+            counts = dict(self.counts)
+        rate = counts['items'] / elapsed if elapsed else 0.0
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        print(f"[{elapsed:.0f}s] {summary} ({rate:.1f} items/s)")
+
+
+def to_json(value):
+    # DynamoDB numbers are Decimals, sets are returned as Python sets
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+class PartWriter:
+    """
+    Gzipped NDJSON parts of one segment, uploaded to S3 whenever a part
+    holds part_items items, so a worker never holds more than one part.
+    """
+
+    def __init__(self, s3, bucket, prefix, segment, part_items, stats):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.segment = segment
+        self.part_items = part_items
+        self.stats = stats
+        self.parts = []
+        self._open()
+
+    def _open(self):
+        self.buffer = io.BytesIO()
+        self.gzip = gzip.GzipFile(fileobj=self.buffer, mode='wb')
+        self.items = 0
+
+    def write(self, item):
+        self.gzip.write(json.dumps(item, default=to_json, separators=(',', ':')).encode('utf-8') + b'\n')
+        self.items += 1
+        if self.items >= self.part_items:
+            self.flush()
+
+    def flush(self):
+        if not self.items:
+            return
+
+        self.gzip.close()
+        body = self.buffer.getvalue()
+        key = f"{self.prefix}/part-{self.segment:04d}-{len(self.parts):05d}.ndjson.gz"
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip'
+        )
+        self.parts.append({'key': key, 'segment': self.segment, 'items': self.items, 'bytes': len(body)})
+        self.stats.add(items=self.items, parts=1, bytes=len(body))
+        self._open()
+
+
+def export_segment(segment, total_segments, table_name, bucket, prefix, part_items, stats):
+    # boto3 sessions are not thread safe, so every worker gets its own
+    session = boto3.session.Session(region_name=vr.region)
+    config = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
+    dynamodb = session.client('dynamodb', config=config)
+    s3 = session.client('s3', config=config)
+    deserializer = TypeDeserializer()
+
+    writer = PartWriter(s3, bucket, prefix, segment, part_items, stats)
+
+    paginator = dynamodb.get_paginator('scan')
+    for page in paginator.paginate(TableName=table_name, Segment=segment, TotalSegments=total_segments):
+        for item in page['Items']:
+            writer.write({name: deserializer.deserialize(value) for name, value in item.items()})
+        stats.report()
+
+    writer.flush()
+    return writer.parts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export RecordsTable to gzipped NDJSON parts in S3 with a parallel Scan.")
+    parser.add_argument("--table", default=vr.records_table_name, help="table to export (default: RecordsTable)")
+    parser.add_argument("--bucket", default=vr.export_bucket_name, help="bucket of the export")
+    parser.add_argument("--prefix", help="key prefix of the export (default: exports/<table>/<UTC time>)")
+    parser.add_argument("--segments", type=int, default=8, help="number of parallel Scan segments")
+    parser.add_argument("--workers", type=int, help="number of concurrent segment workers (default: one per segment)")
+    parser.add_argument("--part-items", type=int, default=100000, help="items per NDJSON part")
+    args = parser.parse_args()
+
+    started = datetime.now(timezone.utc)
+    prefix = args.prefix or f"exports/{args.table}/{started.strftime('%Y-%m-%dT%H-%M-%SZ')}"
+    stats = Stats()
+
+    print(f"Exporting {args.table} to s3://{args.bucket}/{prefix} in {args.segments} segments")
+
+    parts = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers or args.segments) as executor:
+        futures = {
+            executor.submit(export_segment, segment, args.segments, args.table, args.bucket, prefix,
+                            args.part_items, stats): segment
+            for segment in range(args.segments)
+        }
+        for future, segment in futures.items():
+            try:
+                parts.extend(future.result())
+            except Exception as e:
+                print(f"Export of segment {segment} failed: {e}")
+                failed.append(segment)
+
+    stats.report()
+
+    # without a manifest the export is incomplete, readers only trust the parts it lists
+    if failed:
+        print(f"Segments {failed} failed, no manifest written.")
+        sys.exit(1)
+
+    manifest = {
+        'table': args.table,
+        'format': 'ndjson.gz',
+        'started': started.isoformat(),
+        'finished': datetime.now(timezone.utc).isoformat(),
+        'total_segments': args.segments,
+        'items': sum(part['items'] for part in parts),
+        'parts': parts,
+    }
+    manifest_key = f"{prefix}/manifest.json"
+    boto3.client('s3', region_name=vr.region).put_object(
+        Bucket=args.bucket,
+        Key=manifest_key,
+        Body=json.dumps(manifest, indent=2).encode('utf-8'),
+        ContentType='application/json'
+    )
+    print(f"Wrote s3://{args.bucket}/{manifest_key}: {manifest['items']} items in {len(parts)} parts")
+
+
+if __name__ == "__main__":
+    main()
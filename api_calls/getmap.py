@@ -1,4 +1,6 @@
 import boto3
+import gzip
+import os
 import variables as vr
 
 from authenticate  import authenticate_user
@@ -70,7 +72,18 @@ try:
         Key=object_key
     )
     data = response['Body'].read()
-    print('Object data:', data.decode('utf-8'))
+    # maps are stored gzip compressed, browsers decompress them on the fly
+    if response.get('ContentEncoding') == 'gzip':
+        data = gzip.decompress(data)
+    content_type = response.get('ContentType', '')
+    if content_type.startswith('text/') or content_type.startswith('application/json'):
+        print('Object data:', data.decode('utf-8'))
+    else:
+        # binary routes such as the _Track.f32 maps are saved as they are
+        filename = os.path.basename(object_key)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        print(f'Saved {len(data)} bytes of {content_type} to {filename}')
 
 except Exception as e:
     print('Error retrieving object from S3:', str(e))
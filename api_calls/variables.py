@@ -10,4 +10,9 @@ identity_pool_id = 'IDENTITY_POOL_ID'
 bucket_name = 'MAPS_BUCKET_NAME'
 object_key = 'E94821_2023_04_15_474646_Map.html'
 
+csv_bucket_name = 'CSV_BUCKET_NAME'
+trucks_table_name = 'TRUCKS_TABLE_NAME'
+records_table_name = 'RECORDS_TABLE_NAME'
+export_bucket_name = 'EXPORT_BUCKET_NAME'
+
 api_url=f'https://REPLACE.execute-api.{region}.amazonaws.com/prod'
\ No newline at end of file
@@ -0,0 +1,65 @@
+import argparse
+import requests
+import variables as vr
+
+from authenticate import authenticate_user
+
+def make_api_request(url, token, params=None):
+    headers = {
+        'Authorization': token,
+        'Content-Type': 'application/json'
+    }
+
+    response = requests.get(url, headers=headers, params=params)
+    return response.json()
+
+
+def get_all_pages(url, token, params, limit=100):
+    """Follow the cursor of every page until the last one."""
+    items = []
+    params = dict(params, limit=limit)
+
+    while True:
+        page = make_api_request(url, token, params)
+        items.extend(page['items'])
+        print(f"Fetched {len(page['items'])} records, {len(items)} so far")
+
+        if not page.get('cursor'):
+            return items
+        params['cursor'] = page['cursor']
+
+
+parser = argparse.ArgumentParser(description="List the test records of a truck between two dates.")
+parser.add_argument("vin", help="currentVin of the truck")
+parser.add_argument("--from", dest="from_date", help="first date, YYYY-MM-DD")
+parser.add_argument("--to", dest="to_date", help="last date, YYYY-MM-DD")
+parser.add_argument("--fields", help="comma separated attributes to return, e.g. filename,date,map")
+args = parser.parse_args()
+
+params = {'vin': args.vin}
+if args.from_date:
+    params['from'] = args.from_date
+if args.to_date:
+    params['to'] = args.to_date
+if args.fields:
+    params['fields'] = args.fields
+
+# User credentials
+username = vr.username
+password = vr.password
+
+# Cognito user pool and app client details
+user_pool_id = vr.user_pool_id
+app_client_id = vr.user_pool_client_id
+
+# API Gateway endpoint
+api_url = f"{vr.api_url}/records"
+
+# Authenticate user and get the JWT token
+token = authenticate_user(username, password, user_pool_id=user_pool_id, app_client_id=app_client_id)
+
+# Make the API requests
+response = get_all_pages(api_url, token, params)
+
+# Print the response
+print(response)
@@ -20,8 +20,11 @@ records_ddb_stack = RecordsDdbStack(app, "RecordsDdbStack",
 rest_api_stack = RestApiGWStack(app, "RestApiGWStack", 
                                 user_pool=cognito_stack.runlog_user_pool,
                                 add_truck_lambda=trucks_ddb_stack.add_truck_lambda,
+                                geo_query_lambda=records_ddb_stack.geo_query_lambda,
                                 trucks_table=trucks_ddb_stack.trucks_table,
-                                records_table=records_ddb_stack.records_table
+                                records_table=records_ddb_stack.records_table,
+                                vin_date_index_name=records_ddb_stack.vin_date_index_name,
+                                vin_summary_table=records_ddb_stack.vin_summary_table
                                 )
 
 rest_api_stack.add_dependency(cognito_stack)
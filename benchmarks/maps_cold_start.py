@@ -0,0 +1,83 @@
+"""
+Import time and first-invocation latency of MapsLambda per parser.
+
+Every run starts a fresh interpreter, imports lambdas/maps_lambda/index.py
+like a cold Lambda container would, then parses, simplifies and renders
+a local CSV file the way the handler does, without the S3 and DynamoDB calls.
+
+    python benchmarks/maps_cold_start.py --format polyline
+    python benchmarks/maps_cold_start.py --csv test-files/E94821_2023_04_15_474646_PQR.csv --runs 5
+    python benchmarks/maps_cold_start.py --rows 300000
+
+--rows generates a wide GPX export of that many rows instead, the parser
+choice only shows on files far larger than the test file.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LAMBDA_DIR = os.path.join(ROOT, 'lambdas', 'maps_lambda')
+DEFAULT_CSV = os.path.join(ROOT, 'test-files', 'E94821_2023_04_15_474646_PQR.csv')
+
+
+def run_child(path):
+    start = time.perf_counter()
+    sys.path.insert(0, LAMBDA_DIR)
+    import index
+    imported = time.perf_counter()
+
+    with open(path, "rb") as f:
+        track = index.read_track(f, os.path.getsize(path), columnar=bool(index.COLUMNAR_FORMAT))
+    summary = index.summarize_track(track)
+    index.RENDERERS[index.MAP_FORMAT](os.path.basename(path), summary['lat'], summary['lon'])
+    invoked = time.perf_counter()
+
+    print(f"{(imported - start) * 1000:.1f} {(invoked - imported) * 1000:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="CSV file to process")
+    parser.add_argument("--rows", type=int, help="process a generated wide CSV file of this many rows")
+    parser.add_argument("--format", default="polyline", choices=["html", "polyline", "f32", "lod"], help="MAP_FORMAT")
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per parser")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.csv
+        if args.rows:
+            from maps_parse_memory import write_wide_csv
+            path = os.path.join(tmp, "E90000_2023_04_15_000000_PQR.csv")
+            write_wide_csv(path, args.rows)
+
+        env = dict(os.environ, MAP_FORMAT=args.format)
+        env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+        print(f"{os.path.basename(path)}, {os.path.getsize(path) / (1024 * 1024):.1f} MB, MAP_FORMAT={args.format}, "
+              f"{args.runs} cold starts each, median of import / first invocation")
+        for name in ["csv", "pandas", "auto"]:
+            imports, invocations = [], []
+            for _ in range(args.runs):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", path],
+                    env=dict(env, PARSER=name), check=True, capture_output=True, text=True
+                ).stdout.split()
+                imports.append(float(output[-2]))
+                invocations.append(float(output[-1]))
+
+            print(f"{name:>6}: import {statistics.median(imports):7.1f} ms, "
+                  f"first invocation {statistics.median(invocations):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Peak memory of the MapsLambda CSV parse on a synthetic wide GPX export.
+
+Compares the original parse (read the whole body, then all columns) with
+the column-pruned streaming parsers in lambdas/maps_lambda/index.py, called
+the way the handler calls them. --columnar parses the extra columns and the
+full precision read for the COLUMNAR_FORMAT sidecar. Each parser runs in its
+own process so the peaks do not mix.
+
+    python benchmarks/maps_parse_memory.py --rows 1000000
+    python benchmarks/maps_parse_memory.py --rows 300000 --columnar
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'maps_lambda')
+
+GPX_COLUMNS = [
+    "X", "Y", "track_fid", "track_seg_id", "track_seg_point_id", "ele", "time", "magvar",
+    "geoidheight", "name", "cmt", "desc", "src", "link1_href", "link1_text", "link1_type",
+    "link2_href", "link2_text", "link2_type", "sym", "type", "fix", "sat", "hdop", "vdop",
+    "pdop", "ageofdgpsdata", "dgpsid",
+]
+
+
+def write_wide_csv(path, rows):
+    random.seed(0)
+    # magvar ... dgpsid
+    filler = ["", "", "Waypoint", "", "", "GPS", "", "", "", "", "", "", "", "",
+              "3d", "9", "0.9", "1.2", "1.5", "", ""]
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(GPX_COLUMNS) + "\n")
+        x, y = -121.126030040905, 46.7131399735808
+        for i in range(rows):
+            x += random.uniform(-1e-4, 1e-4)
+            y += random.uniform(-1e-4, 1e-4)
+            ele = 400 + random.uniform(-5, 5)
+            seconds = i % 60
+            minutes = (i // 60) % 60
+            hours = (i // 3600) % 24
+            stamp = f"2023-04-15T{hours:02d}:{minutes:02d}:{seconds:02d}Z"
+            f.write(f"{x:.12f},{y:.12f},0,0,{i},{ele:.3f},{stamp}," + ",".join(filler) + "\n")
+
+
+def full_parse(path):
+    import io
+    import pandas as pd
+
+    def parse():
+        with open(path, "rb") as f:
+            body = f.read()
+        return len(pd.read_csv(io.BytesIO(body)))
+
+    return parse
+
+
+def lambda_parse(parser):
+
+    def load(path):
+        os.environ["PARSER"] = parser
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        sys.path.insert(0, LAMBDA_DIR)
+        import index
+
+        # pandas is imported lazily by the Lambda, keep its import out of the measurement
+        if parser == "pandas":
+            import pandas
+
+        def parse():
+            with open(path, "rb") as f:
+                return len(index.read_track(f, os.path.getsize(path), columnar=bool(index.COLUMNAR_FORMAT))['lat'])
+
+        return parse
+
+    return load
+
+
+PARSERS = {"full": full_parse, "pandas": lambda_parse("pandas"), "csv": lambda_parse("csv")}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(name, path):
+    parse = PARSERS[name](path)
+    before = peak_rss_mb()
+    points = parse()
+    after = peak_rss_mb()
+    print(f"{name:>6}: {points} points, peak RSS {after:.1f} MB ({after - before:+.1f} MB for the parse)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--columnar", action="store_true", help="parse for the COLUMNAR_FORMAT sidecar")
+    parser.add_argument("--child", nargs=2, metavar=("PARSER", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "E90000_2023_04_15_000000_PQR.csv")
+        write_wide_csv(path, args.rows)
+        print(f"{args.rows} rows, {os.path.getsize(path) / (1024 * 1024):.1f} MB on disk")
+
+        for name in PARSERS:
+            env = dict(os.environ, COLUMNAR_FORMAT="parquet" if args.columnar else "")
+            subprocess.run([sys.executable, __file__, "--child", name, path], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
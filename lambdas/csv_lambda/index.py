@@ -1,118 +1,187 @@
-from datetime import datetime
 import json
 import urllib.parse
-import re
 import os
 import boto3
+from botocore.exceptions import ClientError
+from records import InvalidKey, parse_key, build_record, batch_get, batch_write
+from truck_cache import TruckCache
 
+TRUCKS_TABLE_NAME = os.environ.get('TRUCKS_TABLE_NAME')
+RECORDS_TABLE_NAME = os.environ.get('RECORDS_TABLE_NAME')
 
-def lambda_handler(event, context):
-    # Get the bucket and key from the S3 event notification
-    bucket_name = event['Records'][0]['s3']['bucket']['name']
-    key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'])
-
-    # Validate the filename for potential XSS attack
-    xss_pattern = re.compile('[<>\"\'&]')
-    if xss_pattern.search(key):
-        print(f"Invalid filename: {key}")
-        return {
-            'statusCode': 400,
-            'body': json.dumps('Invalid filename')
-        }
-
-    # Validate the filename for alphanumeric characters
-    alphanumeric_pattern = re.compile('^[a-zA-Z0-9_\-\.]+$')
-    if not alphanumeric_pattern.match(key):
-        print(f"Invalid filename: {key}")
-        return {
-            'statusCode': 400,
-            'body': json.dumps('Invalid filename')
-        }
-
-    # Extract the VIN and date from the filename
-    vin = key[0:6]
-    date = key[7:17] 
-
-    # Validate the VIN
-    vin_pattern = re.compile('^E9\d{4}$')
-    if not vin_pattern.match(vin):
-        print(f"Invalid VIN: {vin}")
-        return {
-            'statusCode': 400,
-            'body': json.dumps('Invalid VIN')
-        }
-
-    # Validate the date
-    date_pattern = re.compile('^\d{4}_\d{2}_\d{2}$')
-    if not date_pattern.match(date):
-        print(f"Invalid date: {date}")
-        return {
-            'statusCode': 400,
-            'body': json.dumps('Invalid date')
-        }
-    
-    date_obj = datetime.strptime(date, '%Y_%m_%d').date()
-    mf4_filename = key.replace('_PQR.csv', '.MF4')
-
-    # Log the extracted VIN and date
-    print(f"Extracted VIN: {vin}")
-    print(f"Extracted date: {date_obj}")
-    print(f"Data file name: {mf4_filename}")
-    print(f"CSV file name: {key}")
-
-    TRUCKS_TABLE_NAME = os.environ.get('TRUCKS_TABLE_NAME')
-    RECORDS_TABLE_NAME = os.environ.get('RECORDS_TABLE_NAME')
-
-    dynamodb = boto3.resource('dynamodb')
-
-    # Retrieve the table
-    trucks_table = dynamodb.Table(TRUCKS_TABLE_NAME)
-    records_table = dynamodb.Table(RECORDS_TABLE_NAME)
+# 'batch' checks for existing records with BatchGetItem and writes with BatchWriteItem,
+# 'conditional' writes every record with a single attribute_not_exists put
+INGEST_MODE = os.environ.get('INGEST_MODE', 'batch')
 
-    try:
-        # Retrieve the item from the table
-        truck_key = {'currentVin': vin}
-        response = trucks_table.get_item(Key=truck_key)
-        truck_item = response.get('Item')
-
-        if not truck_item:
-            print(f"No record for {vin} in the {trucks_table.table_name}, creating.")
-
-            trucks_table.put_item(
-                Item={
-                    "currentVin": vin
-                }
-            )
-        
-        # check if record exists
-        record_key = {'filename': key}
-        record = records_table.get_item(Key=record_key)
-        record = record.get('Item')
-
-        if not record:
-            # creat test record
-            print(f"No record found for filename: {key}, creating.")
-
-            test_data = {
-                "date": date_obj.isoformat(),
-                "filename": key,
-                "data_filename": mf4_filename
-            }
-
-            if not truck_item:
-                truck_item = {
-                    "currentVin": vin
-                }
-            
-            record_item = {**truck_item, **test_data}
-
-            records_table.put_item(
-                Item=record_item
-            )
+# Truck items are cached across warm invocations
+TRUCK_CACHE_TTL = int(os.environ.get('TRUCK_CACHE_TTL', '300'))
+TRUCK_CACHE_SIZE = int(os.environ.get('TRUCK_CACHE_SIZE', '1024'))
+
+dynamodb = boto3.resource('dynamodb')
+trucks_table = dynamodb.Table(TRUCKS_TABLE_NAME)
+records_table = dynamodb.Table(RECORDS_TABLE_NAME)
+truck_cache = TruckCache(TRUCK_CACHE_TTL, TRUCK_CACHE_SIZE)
 
+
+def put_if_absent(table, item, key_name):
+    """
+    Put an item unless one with the same key already exists.
+    Returns False when the conditional check failed.
+    """
+    try:
+        table.put_item(
+            Item=item,
+            ConditionExpression='attribute_not_exists(#key)',
+            ExpressionAttributeNames={'#key': key_name}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+    return True
+
+
+def cached_trucks(vins):
+    """Split the VINs into cached truck items and the VINs that have to be read."""
+    trucks = {}
+    uncached = set()
+
+    for vin in vins:
+        item = truck_cache.get(vin)
+        if item is None:
+            uncached.add(vin)
         else:
+            trucks[vin] = item
+
+    return trucks, uncached
+
+
+def cache_trucks(found_items):
+    found = {item['currentVin']: item for item in found_items}
+    for vin, item in found.items():
+        truck_cache.put(vin, item)
+    return found
+
+
+def ingest_batched(files, results):
+    vins = {vin for vin, _, _ in files.values()}
+    trucks, uncached = cached_trucks(vins)
+
+    # Resolve the uncached trucks and the existing test records in one batch read
+    found = batch_get(dynamodb, {
+        TRUCKS_TABLE_NAME: [{'currentVin': vin} for vin in uncached],
+        RECORDS_TABLE_NAME: [{'filename': key} for key in files],
+    })
+
+    trucks.update(cache_trucks(found[TRUCKS_TABLE_NAME]))
+    existing = {item['filename'] for item in found[RECORDS_TABLE_NAME]}
+
+    missing_vins = {vin for vin in vins if not trucks.get(vin)}
+    if missing_vins:
+        print(f"No record for {sorted(missing_vins)} in the {TRUCKS_TABLE_NAME}, creating.")
+        placeholders = [{'currentVin': vin} for vin in sorted(missing_vins)]
+        unprocessed = {item['currentVin'] for item in batch_write(dynamodb, TRUCKS_TABLE_NAME, placeholders)}
+        for item in placeholders:
+            if item['currentVin'] in unprocessed:
+                print(f"Could not create truck {item['currentVin']}.")
+            else:
+                trucks[item['currentVin']] = item
+                truck_cache.put(item['currentVin'], item)
+
+    new_records = []
+    for key, (vin, date_obj, mf4_filename) in files.items():
+        if key in existing:
             print(f"Record found for filename: {key}, skipping.")
+            results[key] = {'status': 'exists'}
+            continue
+
+        # no record may point at a truck that does not exist, the retry of
+        # the invocation creates both
+        if not trucks.get(vin):
+            results[key] = {'status': 'failed', 'message': f'Truck {vin} could not be created'}
+            continue
 
-    except Exception as e:
-        print(e)
-        raise e
+        new_records.append(build_record(trucks[vin], key, date_obj, mf4_filename))
+
+    print(f"Creating {len(new_records)} test record(s).")
+    failed = {item['filename'] for item in batch_write(dynamodb, RECORDS_TABLE_NAME, new_records)}
+
+    for item in new_records:
+        if item['filename'] in failed:
+            results[item['filename']] = {'status': 'failed', 'message': 'Unprocessed by DynamoDB'}
+        else:
+            results[item['filename']] = {'status': 'created'}
+
+
+def ingest_conditional(files, results):
+    vins = {vin for vin, _, _ in files.values()}
+    trucks, uncached = cached_trucks(vins)
+
+    if uncached:
+        found = batch_get(dynamodb, {TRUCKS_TABLE_NAME: [{'currentVin': vin} for vin in uncached]})
+        trucks.update(cache_trucks(found[TRUCKS_TABLE_NAME]))
+
+    for vin in sorted(vin for vin in vins if not trucks.get(vin)):
+        trucks[vin] = {'currentVin': vin}
+        if put_if_absent(trucks_table, trucks[vin], 'currentVin'):
+            print(f"No record for {vin} in the {TRUCKS_TABLE_NAME}, created.")
+        truck_cache.put(vin, trucks[vin])
+
+    # A failed condition means the record already exists, e.g. when S3 delivers
+    # the same notification twice, so there is no need to read it first.
+    for key, (vin, date_obj, mf4_filename) in files.items():
+        record_item = build_record(trucks[vin], key, date_obj, mf4_filename)
+        try:
+            if put_if_absent(records_table, record_item, 'filename'):
+                results[key] = {'status': 'created'}
+            else:
+                print(f"Record found for filename: {key}, skipping.")
+                results[key] = {'status': 'exists'}
+        except ClientError as e:
+            print(f"Could not create record {key}: {e}")
+            results[key] = {'status': 'failed', 'message': e.response['Error']['Code']}
+
+
+def lambda_handler(event, context):
+    results = {}
+    files = {}
+
+    # Validate every object in the S3 event notification
+    for s3_record in event['Records']:
+        key = urllib.parse.unquote_plus(s3_record['s3']['object']['key'])
+
+        try:
+            vin, date_obj, mf4_filename = parse_key(key)
+        except InvalidKey as e:
+            print(f"{e}: {key}")
+            results[key] = {'status': 'invalid', 'message': str(e)}
+            continue
+
+        print(f"CSV file name: {key}, VIN: {vin}, date: {date_obj}, data file name: {mf4_filename}")
+        files[key] = (vin, date_obj, mf4_filename)
+
+    if files:
+        try:
+            if INGEST_MODE == 'conditional':
+                ingest_conditional(files, results)
+            else:
+                ingest_batched(files, results)
+
+        except Exception as e:
+            print(e)
+            raise e
+
+    for key, result in results.items():
+        print(f"{key}: {result}")
+
+    print(f"Truck cache: {truck_cache.stats()}")
+
+    # Fail the invocation so S3 retries it when any write was not processed;
+    # records that were already created are skipped on the next attempt.
+    if any(result['status'] == 'failed' for result in results.values()):
+        raise RuntimeError('Some test records could not be created')
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(results)
+    }
@@ -0,0 +1,119 @@
+"""
+Filename validation and test record building shared by CsvLambda
+and the api_calls/backfill.py script.
+"""
+from datetime import datetime
+import re
+import time
+
+# DynamoDB limits for a single BatchGetItem / BatchWriteItem request
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+MAX_BATCH_ATTEMPTS = 5
+
+xss_pattern = re.compile('[<>\"\'&]')
+alphanumeric_pattern = re.compile(r'^[a-zA-Z0-9_\-\.]+$')
+vin_pattern = re.compile(r'^E9\d{4}$')
+date_pattern = re.compile(r'^\d{4}_\d{2}_\d{2}$')
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+def parse_key(key):
+    """Validate a CSV object key and extract the VIN, test date and data file name."""
+
+    # Validate the filename for potential XSS attack
+    if xss_pattern.search(key):
+        raise InvalidKey('Invalid filename')
+
+    # Validate the filename for alphanumeric characters
+    if not alphanumeric_pattern.match(key):
+        raise InvalidKey('Invalid filename')
+
+    # Extract the VIN and date from the filename
+    vin = key[0:6]
+    date = key[7:17]
+
+    if not vin_pattern.match(vin):
+        raise InvalidKey('Invalid VIN')
+
+    if not date_pattern.match(date):
+        raise InvalidKey('Invalid date')
+
+    try:
+        date_obj = datetime.strptime(date, '%Y_%m_%d').date()
+    except ValueError:
+        raise InvalidKey('Invalid date')
+
+    mf4_filename = key.replace('_PQR.csv', '.MF4')
+
+    return vin, date_obj, mf4_filename
+
+
+def backoff(attempt):
+    time.sleep(min(0.05 * 2 ** attempt, 1.0))
+
+
+def batch_get(dynamodb, keys_by_table):
+    """
+    Read items from one or more tables with BatchGetItem.
+    Takes {table_name: [key, ...]} and returns {table_name: [item, ...]}.
+    """
+    pending = [(table, key) for table, keys in keys_by_table.items() for key in keys]
+    found = {table: [] for table in keys_by_table}
+
+    for i in range(0, len(pending), BATCH_GET_SIZE):
+        request = {}
+        for table, key in pending[i:i + BATCH_GET_SIZE]:
+            request.setdefault(table, {'Keys': []})['Keys'].append(key)
+
+        attempt = 0
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for table, items in response.get('Responses', {}).items():
+                found[table].extend(items)
+
+            request = response.get('UnprocessedKeys')
+            if request:
+                attempt += 1
+                if attempt >= MAX_BATCH_ATTEMPTS:
+                    raise RuntimeError(f"Could not read {len(request)} table(s) after {attempt} attempts")
+                backoff(attempt)
+
+    return found
+
+
+def batch_write(dynamodb, table_name, items):
+    """
+    Put items into a table with BatchWriteItem, retrying unprocessed items.
+    Returns the items that could still not be written.
+    """
+    failed = []
+
+    for i in range(0, len(items), BATCH_WRITE_SIZE):
+        requests = [{'PutRequest': {'Item': item}} for item in items[i:i + BATCH_WRITE_SIZE]]
+
+        attempt = 0
+        while requests:
+            response = dynamodb.batch_write_item(RequestItems={table_name: requests})
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if requests:
+                attempt += 1
+                if attempt >= MAX_BATCH_ATTEMPTS:
+                    failed.extend(r['PutRequest']['Item'] for r in requests)
+                    break
+                backoff(attempt)
+
+    return failed
+
+
+def build_record(truck_item, key, date_obj, mf4_filename):
+    """Create the RecordsTable item for a CSV file from the truck configuration."""
+    test_data = {
+        "date": date_obj.isoformat(),
+        "filename": key,
+        "data_filename": mf4_filename
+    }
+    return {**truck_item, **test_data}
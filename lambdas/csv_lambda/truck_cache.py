@@ -0,0 +1,38 @@
+import time
+from collections import OrderedDict
+
+class TruckCache:
+    """
+    Size-bounded LRU cache of TrucksTable items with a TTL.
+    Only trucks that exist are cached, an unknown VIN is read again,
+    as its placeholder is created right after the lookup.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, vin):
+        entry = self._entries.get(vin)
+
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(vin, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(vin)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, vin, item):
+        self._entries[vin] = (time.monotonic() + self.ttl, item)
+        self._entries.move_to_end(vin)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return f"{self.hits} hits, {self.misses} misses, {len(self._entries)} entries"
@@ -0,0 +1,74 @@
+import math
+
+ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def grid(precision):
+    """Number of latitude and longitude bits, and the cell size in degrees."""
+    bits = 5 * precision
+    lat_bits = bits // 2
+    lon_bits = (bits + 1) // 2
+    return lat_bits, lon_bits, 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cell(lat_index, lon_index, precision):
+    """Geohash of the cell at the given row and column of the precision's grid."""
+    lat_bits, lon_bits, _, _ = grid(precision)
+
+    # geohash bits alternate longitude, latitude, longitude, ...
+    code = 0
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            bit = (lon_index >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_index >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    return ''.join(ALPHABET[(code >> (5 * i)) & 0x1f] for i in range(precision - 1, -1, -1))
+
+
+def bounds(geohash):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        value = ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds_range = lon_range if even else lat_range
+            middle = (bounds_range[0] + bounds_range[1]) / 2
+            if (value >> shift) & 1:
+                bounds_range[0] = middle
+            else:
+                bounds_range[1] = middle
+            even = not even
+
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def index_range(low, high, origin, size, count):
+    first = min(max(int(math.floor((low - origin) / size)), 0), count - 1)
+    last = min(max(int(math.floor((high - origin) / size)), 0), count - 1)
+    return first, last
+
+
+def cover_size(min_lat, min_lon, max_lat, max_lon, precision):
+    """Number of cells cover() returns, without enumerating them."""
+    lat_bits, lon_bits, lat_size, lon_size = grid(precision)
+    first_lat, last_lat = index_range(min_lat, max_lat, -90.0, lat_size, 1 << lat_bits)
+    first_lon, last_lon = index_range(min_lon, max_lon, -180.0, lon_size, 1 << lon_bits)
+    return (last_lat - first_lat + 1) * (last_lon - first_lon + 1)
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, precision):
+    """The geohash cells at the given precision that intersect the box."""
+    lat_bits, lon_bits, lat_size, lon_size = grid(precision)
+    first_lat, last_lat = index_range(min_lat, max_lat, -90.0, lat_size, 1 << lat_bits)
+    first_lon, last_lon = index_range(min_lon, max_lon, -180.0, lon_size, 1 << lon_bits)
+
+    return [
+        cell(lat_index, lon_index, precision)
+        for lat_index in range(first_lat, last_lat + 1)
+        for lon_index in range(first_lon, last_lon + 1)
+    ]
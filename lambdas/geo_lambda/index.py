@@ -0,0 +1,89 @@
+import json
+import os
+import boto3
+from boto3.dynamodb.conditions import Key
+import geohash
+
+GEO_INDEX_TABLE = os.environ.get('GEO_INDEX_TABLE')
+
+# Precision of the cells written by MapsLambda, and of the partition key prefix
+GEOHASH_PRECISION = int(os.environ.get('GEOHASH_PRECISION', '6'))
+GEOHASH_PREFIX_PRECISION = int(os.environ.get('GEOHASH_PREFIX_PRECISION', '3'))
+# Upper bound of the DynamoDB queries for one request
+MAX_QUERY_CELLS = int(os.environ.get('MAX_QUERY_CELLS', '64'))
+
+BOX_PARAMETERS = ('min_lat', 'min_lon', 'max_lat', 'max_lon')
+
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(GEO_INDEX_TABLE)
+
+
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body)
+    }
+
+
+def query_precision(box):
+    """
+    The finest precision, between the partition prefix and the indexed cells,
+    whose cover of the box stays within MAX_QUERY_CELLS queries.
+    """
+    for precision in range(GEOHASH_PRECISION, GEOHASH_PREFIX_PRECISION - 1, -1):
+        if geohash.cover_size(*box, precision) <= MAX_QUERY_CELLS:
+            return precision
+    return None
+
+
+def intersects(cell, box):
+    min_lat, min_lon, max_lat, max_lon = geohash.bounds(cell)
+    return min_lat <= box[2] and max_lat >= box[0] and min_lon <= box[3] and max_lon >= box[1]
+
+
+def query_cell(cell):
+    """Index items of every run with a point in the cell or its sub-cells."""
+    query = {
+        'KeyConditionExpression': Key('cell_prefix').eq(cell[:GEOHASH_PREFIX_PRECISION])
+                                  & Key('cell_run').begins_with(cell)
+    }
+
+    while True:
+        result = table.query(**query)
+        yield from result['Items']
+
+        if 'LastEvaluatedKey' not in result:
+            break
+        query['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def lambda_handler(event, context):
+    params = event.get('queryStringParameters') or {}
+
+    try:
+        box = tuple(float(params[name]) for name in BOX_PARAMETERS)
+    except (KeyError, TypeError, ValueError):
+        return response(400, {'message': f"Query parameters {', '.join(BOX_PARAMETERS)} are required numbers"})
+
+    if not (-90 <= box[0] <= box[2] <= 90 and -180 <= box[1] <= box[3] <= 180):
+        return response(400, {'message': 'Invalid query box'})
+
+    precision = query_precision(box)
+    if precision is None:
+        return response(400, {'message': 'Query box is too large'})
+
+    cells = geohash.cover(*box, precision)
+    print(f"Querying {len(cells)} cells at precision {precision} for {box}")
+
+    runs = {}
+    for cell in cells:
+        for item in query_cell(cell):
+            if item['filename'] not in runs and intersects(item['cell'], box):
+                runs[item['filename']] = {
+                    'filename': item['filename'],
+                    'currentVin': item.get('currentVin'),
+                    'date': item.get('date'),
+                    'map': item.get('map'),
+                }
+
+    return response(200, sorted(runs.values(), key=lambda run: (run['date'] or '', run['filename'])))
@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+
+CONTENT_TYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+}
+
+
+def columnar_key(filename, vin, date, columnar_format):
+    """Hive-style partitions so query engines can prune on VIN and date."""
+    stem = filename.replace("_PQR.csv", "")
+    return f"columnar/vin={vin}/date={date}/{stem}.{columnar_format}"
+
+
+def track_table(track):
+    import pyarrow as pa
+
+    def integers(values):
+        return pa.array(values, mask=np.isnan(values)).cast(pa.int32())
+
+    return pa.table({
+        'lat': pa.array(track['lat'], type=pa.float64()),
+        'lon': pa.array(track['lon'], type=pa.float64()),
+        'ele': pa.array(track['ele'], type=pa.float32(), from_pandas=True),
+        'time': pa.array(track['time'], type=pa.timestamp('ms', tz='UTC'), from_pandas=True),
+        'segment': integers(track['segment']),
+        'point': integers(track['point']),
+    })
+
+
+def write_columnar(track, columnar_format):
+    """Serialize the typed track columns to Parquet or Arrow IPC bytes."""
+    table = track_table(track)
+    sink = io.BytesIO()
+
+    if columnar_format == 'arrow':
+        import pyarrow as pa
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink, compression='zstd')
+
+    return sink.getvalue()
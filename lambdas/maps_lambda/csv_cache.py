@@ -0,0 +1,132 @@
+import hashlib
+import io
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+
+class CsvCache:
+    """
+    Size-bounded LRU cache of S3 objects on local disk, for the /tmp of a
+    warm Lambda container. Entries are keyed by bucket, key and ETag, so a
+    changed object is never served from the cache. Cached files are read
+    through mmap, the parser reads them from the page cache without a copy
+    of the whole file on the heap.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        # bytes of the downloads in progress, counted against max_bytes
+        self._reserved = 0
+
+        # files left by earlier invocations of this container, oldest first,
+        # and partial downloads of invocations that ended while downloading
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name in os.listdir(directory):
+            if name.endswith('.part'):
+                os.remove(os.path.join(directory, name))
+            else:
+                paths.append(os.path.join(directory, name))
+        for path in sorted(paths, key=os.path.getmtime):
+            self._entries[path] = os.path.getsize(path)
+            self._size += self._entries[path]
+
+    def path(self, bucket, key, etag):
+        name = hashlib.sha256(f"{bucket}/{key}/{etag}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def open(self, s3, bucket, key, etag, size):
+        """
+        File-like body of the object with the given ETag, from the disk cache
+        or downloaded into it. Objects that do not fit in the cache next to
+        the downloads in progress are streamed from S3 as they are. The
+        caller closes the body.
+        """
+        path = self.path(bucket, key, etag)
+
+        # the file is mapped while no other thread can evict it
+        with self._lock:
+            body = None
+            if path in self._entries:
+                self._entries.move_to_end(path)
+                body = self._map(path)
+                self.hits += 1
+                self.bytes_saved += size
+            else:
+                self.misses += 1
+                reserved = self._reserve(size)
+
+        if body is not None:
+            print(f"CSV cache hit for {key}, {size} bytes not downloaded.")
+            return body
+
+        obj = s3.get_object(Bucket=bucket, Key=key, IfMatch=etag)
+        # objects that do not fit next to the other downloads are not cached
+        if not reserved:
+            return obj['Body']
+
+        # download next to the cache entry and rename, readers never see a partial file
+        part = f"{path}.{threading.get_ident()}.part"
+        try:
+            with open(part, 'wb') as f:
+                for chunk in obj['Body'].iter_chunks(1024 * 1024):
+                    f.write(chunk)
+            body = self._map(part)
+        except BaseException:
+            with self._lock:
+                self._reserved -= size
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+        # renamed and published together, so an eviction never removes a file
+        # that is then published, and the mapping outlives an eviction
+        with self._lock:
+            self._reserved -= size
+            os.replace(part, path)
+            if path in self._entries:
+                # downloaded by another thread at the same time
+                self._entries.move_to_end(path)
+            else:
+                self._entries[path] = size
+                self._size += size
+            self._evict()
+
+        return body
+
+    def _map(self, path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _reserve(self, size):
+        """Reserve the space of a download, evicting cached files for it. Called with the lock held."""
+        if self._reserved + size > self.max_bytes:
+            return False
+        self._reserved += size
+        self._evict()
+        return True
+
+    def _evict(self):
+        # an evicted file that is still mapped stays readable until it is closed
+        while self._size + self._reserved > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return (f"{self.hits} hits, {self.misses} misses, {self.bytes_saved} bytes saved, "
+                f"{len(self._entries)} files, {self._size} bytes")
@@ -0,0 +1,38 @@
+import numpy as np
+
+# 1e-5 degrees, about a metre, matches the default simplification tolerance
+POLYLINE_PRECISION = 5
+
+# enough 5-bit groups for any zigzag encoded delta of a coordinate
+MAX_GROUPS = 7
+
+
+def encode_polyline(lat, lon, precision=POLYLINE_PRECISION):
+    """
+    Encode coordinates with the Google encoded polyline algorithm.
+    The deltas, zigzag encoding and 5-bit groups are computed for
+    all points at once, the result is ASCII bytes.
+    """
+    if len(lat) == 0:
+        return b''
+
+    factor = 10 ** precision
+    points = np.round(np.column_stack([lat, lon]) * factor).astype(np.int64)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    shifts = 5 * np.arange(MAX_GROUPS)
+    groups = (values[:, None] >> shifts) & 0x1f
+
+    # every value needs at least one group, all but its last carry the continuation bit
+    counts = np.maximum(1, np.sum((values[:, None] >> shifts) > 0, axis=1))
+    used = np.arange(MAX_GROUPS) < counts[:, None]
+    more = np.arange(MAX_GROUPS) < (counts - 1)[:, None]
+
+    chars = (groups | np.where(more, 0x20, 0)) + 63
+    return chars[used].astype(np.uint8).tobytes()
+
+
+def pack_float32(lat, lon):
+    """Interleaved little-endian float32 lat, lon pairs."""
+    return np.column_stack([lat, lon]).astype('<f4').tobytes()
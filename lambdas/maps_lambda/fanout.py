@@ -0,0 +1,71 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+# bytes read around a nominal chunk boundary to find the next line break,
+# far longer than a row of the GPX exports
+PROBE_BYTES = 64 * 1024
+# concurrent ranged GETs that align the chunk boundaries
+PROBE_WORKERS = 16
+
+
+class PrefixedBody(io.RawIOBase):
+    """A streaming body read after the given prefix, e.g. a chunk of rows after the CSV header."""
+
+    def __init__(self, prefix, body):
+        self.prefix = prefix
+        self.body = body
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            data, self.prefix = self.prefix[:len(buffer)], self.prefix[len(buffer):]
+        else:
+            data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_range(s3, bucket, key, start, end, etag=None, prefix=b''):
+    """File-like body of the bytes [start, end) of an object, read after prefix."""
+    request = {'Bucket': bucket, 'Key': key, 'Range': f"bytes={start}-{end - 1}"}
+    if etag:
+        request['IfMatch'] = etag
+    body = s3.get_object(**request)['Body']
+    return io.BufferedReader(PrefixedBody(prefix, body))
+
+
+def next_line_start(s3, bucket, key, position, size, etag=None):
+    """Offset of the first line that starts after position, or None if there is none in the probe."""
+    probe = read_range(s3, bucket, key, position, min(position + PROBE_BYTES, size), etag).read()
+    newline = probe.find(b'\n')
+    return position + newline + 1 if newline >= 0 else None
+
+
+def split_rows(s3, bucket, key, size, count, etag=None):
+    """
+    Split a CSV object into at most count byte ranges of whole rows with
+    ranged GETs. The nominal boundaries are moved forward to the next line
+    break, so no row is cut in two. Returns the header line and the
+    [(start, end)] ranges of the rows after it.
+    """
+    header = read_range(s3, bucket, key, 0, min(PROBE_BYTES, size), etag).read()
+    newline = header.find(b'\n')
+    if newline < 0:
+        raise ValueError(f"No header line in the first {PROBE_BYTES} bytes of {key}")
+    header = header[:newline + 1]
+
+    first = len(header)
+    nominal = [first + (size - first) * i // count for i in range(1, count)]
+    with ThreadPoolExecutor(max_workers=max(min(len(nominal), PROBE_WORKERS), 1)) as executor:
+        aligned = executor.map(lambda position: next_line_start(s3, bucket, key, position, size, etag), nominal)
+
+    boundaries = [first]
+    for boundary in aligned:
+        # a boundary in the last row, or one that lands in the previous range, merges two ranges
+        if boundary is not None and boundaries[-1] < boundary < size:
+            boundaries.append(boundary)
+    boundaries.append(size)
+
+    return header, [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if start < end]
@@ -0,0 +1,96 @@
+import gzip
+import json
+import random
+import time
+
+MAX_ATTEMPTS = 8
+
+# S3 rejects a conditional put when the object changed since it was read
+CONFLICT_CODES = ('PreconditionFailed', 'ConditionalRequestConflict')
+
+
+def index_key(vin):
+    return f"fleet/{vin}/index.json"
+
+
+def month_file(date):
+    # runs are partitioned by the month of their date, YYYY-MM-DD
+    return f"{date[:7]}.ndjson"
+
+
+def read_object(s3, bucket, key):
+    """Decompressed body of a fleet object and its ETag, or None and None if it does not exist yet."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return None, None
+
+    return gzip.decompress(obj['Body'].read()).decode('utf-8'), obj['ETag']
+
+
+def update_object(s3, bucket, key, update, content_type):
+    """
+    Replace a fleet object with update(body), body being None while the
+    object does not exist, with a conditional put. The object is read again
+    when another worker updated it in the meantime. update returns None when
+    the object already holds its change. Returns the body that was written.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        body, etag = read_object(s3, bucket, key)
+        updated = update(body)
+        if updated is None:
+            return body
+
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=gzip.compress(updated.encode('utf-8')),
+                ContentType=content_type,
+                ContentEncoding='gzip',
+                **condition
+            )
+            return updated
+
+        except s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] not in CONFLICT_CODES:
+                raise
+            print(f"{key} changed while it was updated, retrying.")
+            time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+    raise RuntimeError(f"Could not update {key} after {MAX_ATTEMPTS} attempts")
+
+
+def add_run(s3, bucket, vin, run):
+    """
+    Append a run, {filename, date, ...}, to the routes of the VIN. Runs are
+    kept in one NDJSON file per month, fleet/<VIN>/<YYYY-MM>.ndjson, so an
+    append only copies the lines of the runs of that month, and only runs of
+    the same month compete for the file. fleet/<VIN>/index.json lists the
+    month files and is only written when a month is added to it.
+    Returns the key of the index and the number of runs in the month.
+    """
+    month = month_file(run['date'])
+    month_key = f"fleet/{vin}/{month}"
+    line = json.dumps(run, separators=(',', ':'))
+    # lines start with the filename, a retried record replaces its own line
+    own_prefix = json.dumps({'filename': run['filename']}, separators=(',', ':'))[:-1] + ','
+
+    def append(body):
+        lines = [existing for existing in (body or '').splitlines() if not existing.startswith(own_prefix)]
+        lines.append(line)
+        return '\n'.join(lines) + '\n'
+
+    # the month file is written first, so the index never lists a month
+    # without runs, and a retry adds a month that is still missing
+    def add_month(body):
+        index = json.loads(body) if body else {'vin': vin, 'files': []}
+        if month in index['files']:
+            return None
+        index['files'] = sorted(index['files'] + [month])
+        return json.dumps(index, separators=(',', ':'))
+
+    runs = update_object(s3, bucket, month_key, append, 'application/x-ndjson').count('\n')
+    update_object(s3, bucket, index_key(vin), add_month, 'application/json')
+    return index_key(vin), runs
@@ -0,0 +1,96 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project(lat, lon):
+    """
+    Project coordinates in degrees onto a local equirectangular plane in metres.
+    Accurate enough for tolerances of a few metres over a single drive.
+    """
+    lat0 = np.radians(np.nanmean(lat))
+    x = np.radians(lon) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def segment_distances(px, py, ax, ay, bx, by):
+    """Distances from points (px, py) to the segment between (ax, ay) and (bx, by)."""
+    dx = bx - ax
+    dy = by - ay
+    length2 = dx * dx + dy * dy
+
+    if length2 == 0:
+        return np.hypot(px - ax, py - ay)
+
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / length2, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify(lat, lon, tolerance):
+    """
+    Douglas-Peucker line simplification with the tolerance in metres.
+    The distances for each split are computed with one vectorized pass,
+    returns the indices of the points to keep.
+    """
+    n = len(lat)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+
+    x, y = project(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        distances = segment_distances(
+            x[start + 1:end], y[start + 1:end],
+            x[start], y[start], x[end], y[end]
+        )
+        i = int(np.argmax(distances))
+
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return np.flatnonzero(keep)
+
+
+GEOHASH_ALPHABET = np.frombuffer(b'0123456789bcdefghjkmnpqrstuvwxyz', dtype=np.uint8)
+
+
+def geohash_cells(lat, lon, precision):
+    """
+    The distinct geohash cells at the given precision that contain the points.
+    Quantizes all points at once and interleaves the longitude and latitude
+    bits column by column instead of bisecting point by point.
+    """
+    if len(lat) == 0:
+        return []
+
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+
+    lat_index = np.clip(((np.asarray(lat) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    lon_index = np.clip(((np.asarray(lon) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+
+    # geohash bits alternate longitude, latitude, longitude, ...
+    codes = np.zeros(len(lat_index), dtype=np.int64)
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (lon_index >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_index >> (lat_bits - 1 - i // 2)) & 1
+        codes = (codes << 1) | bit
+
+    codes = np.unique(codes)
+    groups = (codes[:, None] >> (5 * np.arange(precision - 1, -1, -1))) & 0x1f
+    return [row.tobytes().decode('ascii') for row in GEOHASH_ALPHABET[groups]]
@@ -1,101 +1,655 @@
 import boto3
+import gzip
+import hashlib
+import json
 import os
-import io
-import folium
-import pandas as pd
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from botocore.config import Config
+import numpy as np
+from columnar import CONTENT_TYPES, columnar_key, write_columnar
+from csv_cache import CsvCache
+from encoding import encode_polyline, pack_float32
+from fanout import read_range, split_rows
+from fleet import add_run
+from geometry import geohash_cells, simplify
+from lod import build_lod, encode_manifest
+from parsing import FLOAT, TIME, read_columns_csv, read_columns_pandas
+from stats import merge_stats, to_dynamodb, track_stats
 
 CSV_BUCKET = os.environ.get('CSV_BUCKET')
 MAPS_BUCKET = os.environ.get('MAPS_BUCKET')
 RECORDS_TABLE = os.environ.get('RECORDS_TABLE')
+GEO_INDEX_TABLE = os.environ.get('GEO_INDEX_TABLE')
+# artifacts generated per distinct CSV content, empty disables the cache
+MAP_CACHE_TABLE = os.environ.get('MAP_CACHE_TABLE', '')
 
-def lambda_handler(event, context):
-    
-    try:
-        for record in event['Records']:
-            if record['eventName'] == 'INSERT':
-                
-                filename = record['dynamodb']['NewImage']['filename']['S']
-                print(f"Processing file {filename}")
-        
-        X = 'X'
-        Y  = 'Y'
+X = 'X'
+Y = 'Y'
 
-        try:
-            # Read the CSV file containing the coordinates
-            s3 = boto3.client("s3")
-            obj = s3.get_object(Bucket=CSV_BUCKET, Key=filename)
-            body = obj['Body'].read()
-            df = pd.read_csv(io.BytesIO(body))
+# CSV columns read for the map and the statistics, and the extra ones read for the columnar sidecar
+COORD_COLUMNS = {X: FLOAT, Y: FLOAT}
+STATS_COLUMNS = {'ele': FLOAT, 'time': TIME}
+SEGMENT_COLUMNS = {'track_seg_id': FLOAT, 'track_seg_point_id': FLOAT}
 
+# float32 keeps coordinates to well under a metre while halving memory
+COORD_DTYPE = os.environ.get('COORD_DTYPE', 'float32')
+# 'csv' parses with the stdlib csv module and NumPy, 'pandas' imports pandas on first use.
+# 'auto' uses csv for files below PANDAS_MIN_BYTES: pandas takes about 0.45 s to
+# import but parses the wide GPX exports about 3 times faster, which pays off
+# from about 50k rows (6 MB). Once pandas is imported, it parses every file.
+PARSER = os.environ.get('PARSER', 'auto')
+PANDAS_MIN_BYTES = int(os.environ.get('PANDAS_MIN_BYTES', str(6 * 1024 * 1024)))
+# parse the CSV with pandas in chunks of this many rows, collected into arrays
+# chunk by chunk, so the time strings of the whole file are never in memory
+# at once, 0 parses it in one go
+CSV_CHUNK_ROWS = int(os.environ.get('CSV_CHUNK_ROWS', '20000'))
+# maximum deviation of the drawn route from the recorded track, 0 disables simplification
+SIMPLIFY_TOLERANCE_M = float(os.environ.get('SIMPLIFY_TOLERANCE_M', '5'))
+# number of maps generated in parallel from one stream batch
+MAP_WORKERS = int(os.environ.get('MAP_WORKERS', '4'))
+# 'html' renders a Folium map per run, 'polyline' and 'f32' upload only the
+# route for the shared viewer.html, which skips importing Folium altogether.
+# 'lod' uploads levels of detail of the route that the viewer loads by zoom.
+MAP_FORMAT = os.environ.get('MAP_FORMAT', 'html')
+# every coarser level of detail simplifies the previous one with LOD_FACTOR
+# times its tolerance, down to a level of at most LOD_MIN_POINTS points
+LOD_FACTOR = float(os.environ.get('LOD_FACTOR', '4'))
+LOD_MIN_POINTS = int(os.environ.get('LOD_MIN_POINTS', '1000'))
+LOD_CHUNK_POINTS = int(os.environ.get('LOD_CHUNK_POINTS', '2000'))
+VIEWER_KEY = 'viewer.html'
+# 'parquet' or 'arrow' writes a typed copy of every track under columnar/ in the
+# maps bucket, partitioned by VIN and date. Empty disables the sidecar.
+COLUMNAR_FORMAT = os.environ.get('COLUMNAR_FORMAT', '')
+# keep the routes of all runs of a VIN in fleet/<VIN>/<YYYY-MM>.ndjson for the
+# viewer, simplified with a coarser tolerance than the per-run maps
+FLEET_MAPS = os.environ.get('FLEET_MAPS', 'true') == 'true'
+FLEET_TOLERANCE_M = float(os.environ.get('FLEET_TOLERANCE_M', '20'))
+# runs are indexed by the geohash cells their points fall in, partitioned by a
+# shorter prefix of the cell, see lambdas/geo_lambda/index.py
+GEOHASH_PRECISION = int(os.environ.get('GEOHASH_PRECISION', '6'))
+GEOHASH_PREFIX_PRECISION = int(os.environ.get('GEOHASH_PREFIX_PRECISION', '3'))
 
-            # Create a map centered on the first coordinate in the CSV file
-            m = folium.Map(location=[df[X][0], df[Y][0]], zoom_start=6, tiles="Stamen Terrain")
+# CSV files larger than FANOUT_BYTES are split into chunks of rows of about
+# FANOUT_CHUNK_BYTES that are parsed and simplified in parallel, by invocations
+# of this function with FANOUT_MODE 'lambda', or by local processes with
+# 'process', at most FANOUT_WORKERS at a time. 0 disables it.
+FANOUT_BYTES = int(os.environ.get('FANOUT_BYTES', '0'))
+FANOUT_CHUNK_BYTES = int(os.environ.get('FANOUT_CHUNK_BYTES', str(32 * 1024 * 1024)))
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', '8'))
+FANOUT_MODE = os.environ.get('FANOUT_MODE', 'lambda')
+# function that parses the chunks, this function itself when not set
+CHUNK_FUNCTION = os.environ.get('CHUNK_FUNCTION') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+# a synchronous invoke returns at most 6 MB, larger chunk summaries are passed
+# through fanout/ in the maps bucket
+CHUNK_PAYLOAD_BYTES = int(os.environ.get('CHUNK_PAYLOAD_BYTES', str(5 * 1024 * 1024)))
 
-            # Add a line connecting the markers in the CSV file
-            route = folium.PolyLine(locations=df[[Y, X]].values.tolist(), color='red')
-            route.add_to(m)
-            bounds = route.get_bounds()
-            m.fit_bounds(bounds)
+# CSV files are kept in /tmp between warm invocations, so retries and repeated
+# processing of a file do not download it again. 0 disables the cache.
+CSV_CACHE_BYTES = int(os.environ.get('CSV_CACHE_BYTES', '0'))
+CSV_CACHE_DIR = os.environ.get('CSV_CACHE_DIR', '/tmp/csv_cache')
 
-        except Exception as e:
-            print("Error reading the CSV files.")
-            print(e)
-            raise
+# boto3 clients are thread safe, resources are not and are created per worker thread
+s3 = boto3.client("s3")
+thread_local = threading.local()
+viewer_lock = threading.Lock()
+viewer_uploaded = False
+csv_cache = CsvCache(CSV_CACHE_DIR, CSV_CACHE_BYTES) if CSV_CACHE_BYTES else None
+# identical files of one batch wait for the first one instead of rendering it twice
+content_locks = {}
+content_locks_lock = threading.Lock()
 
-        try:
-            # Save the map as an HTML file
-            map_filename = filename.replace("_PQR.csv", "_Map.html")
-            map_holder = f"/tmp/{map_filename}"
-            m.save(map_holder)
-            print(f"Generated the map {map_holder}.")
-            
-        except Exception as e:
-            print("Error saving the map file")
-            print(e)
-            raise
 
-        try:
-            # s3.put_object(Bucket=MAPS_BUCKET, Key=f"{map_filename}", body=m)
-            s3.upload_file(map_holder, MAPS_BUCKET, map_filename)
-            print("Uploaded the map to destionation S3 bucket.")
+def dynamodb_table(table_name):
+    if not hasattr(thread_local, 'dynamodb'):
+        thread_local.dynamodb = boto3.session.Session().resource('dynamodb')
+    return thread_local.dynamodb.Table(table_name)
+
+
+def choose_parser(size):
+    """The parser for a CSV body of size bytes, 0 if unknown."""
+    if PARSER != 'auto':
+        return PARSER
+    if size >= PANDAS_MIN_BYTES or 'pandas' in sys.modules:
+        return 'pandas'
+    return 'csv'
+
+
+def read_track(body, size=0, columnar=False):
+    """
+    Parse the coordinates, elevation and time, and for the columnar sidecar
+    also the segment columns, from a file-like CSV body of size bytes. The
+    other GPX export columns are skipped by the parser, so memory grows with
+    the number of points only.
+    Returns {lat, lon, ele, time[, segment, point]} for the rows with coordinates.
+    """
+    columns = {**COORD_COLUMNS, **STATS_COLUMNS}
+    if columnar:
+        columns.update(SEGMENT_COLUMNS)
+    # the sidecar is kept for analytics, so it keeps full precision
+    dtype = 'float64' if columnar else COORD_DTYPE
+
+    if choose_parser(size) == 'pandas':
+        parsed = read_columns_pandas(body, columns, COORD_COLUMNS, dtype, CSV_CHUNK_ROWS)
+    else:
+        parsed = read_columns_csv(body, columns, COORD_COLUMNS, dtype)
+
+    lat = parsed[Y].astype('float64')
+    lon = parsed[X].astype('float64')
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+
+    track = {'lat': lat[valid], 'lon': lon[valid], 'ele': parsed['ele'][valid], 'time': parsed['time'][valid]}
+    if columnar:
+        track['segment'] = parsed['track_seg_id'][valid]
+        track['point'] = parsed['track_seg_point_id'][valid]
+
+    return track
+
+
+def render_html(filename, lat, lon):
+    import folium
+
+    # Create a map centered on the first coordinate in the CSV file
+    m = folium.Map(location=[lat[0], lon[0]], zoom_start=6, tiles="Stamen Terrain")
+
+    # Add a line connecting the markers in the CSV file
+    locations = list(zip(lat.round(6).tolist(), lon.round(6).tolist()))
+    route = folium.PolyLine(locations=locations, color='red')
+    route.add_to(m)
+    bounds = route.get_bounds()
+    m.fit_bounds(bounds)
+
+    map_filename = filename.replace("_PQR.csv", "_Map.html")
+    return map_filename, m.get_root().render().encode('utf-8'), 'text/html; charset=utf-8', []
+
+
+def render_polyline(filename, lat, lon):
+    map_filename = filename.replace("_PQR.csv", "_Track.polyline")
+    return map_filename, encode_polyline(lat, lon), 'text/plain; charset=utf-8', []
+
+
+def render_float32(filename, lat, lon):
+    map_filename = filename.replace("_PQR.csv", "_Track.f32")
+    return map_filename, pack_float32(lat, lon), 'application/octet-stream', []
+
+
+def render_lod(filename, lat, lon):
+    """The manifest of the levels of detail, with the level chunks as extra objects."""
+    prefix = filename.replace("_PQR.csv", "_Lod")
+    manifest, chunks = build_lod(
+        prefix, lat, lon, SIMPLIFY_TOLERANCE_M,
+        factor=LOD_FACTOR, min_points=LOD_MIN_POINTS, chunk_points=LOD_CHUNK_POINTS
+    )
+    parts = [(key, body, 'text/plain; charset=utf-8') for key, body in chunks]
+    return f"{prefix}/manifest.json", encode_manifest(manifest), 'application/json', parts
+
+
+RENDERERS = {
+    'html': render_html,
+    'polyline': render_polyline,
+    'f32': render_float32,
+    'lod': render_lod,
+}
 
-        except Exception as e:
-            print("Error uploading the map to S3 bucket.")
-            print(e)
-            raise
+
+def upload_compressed(key, body, content_type):
+    """Upload a gzip compressed body that browsers decompress on the fly."""
+    s3.put_object(
+        Bucket=MAPS_BUCKET,
+        Key=key,
+        Body=body,
+        ContentType=content_type,
+        ContentEncoding='gzip'
+    )
+
+
+def upload_viewer():
+    """
+    Upload the shared viewer for the compact formats and fleet files once per
+    container, whenever the deployed viewer differs from the one in the bucket.
+    """
+    global viewer_uploaded
+
+    with viewer_lock:
+        if viewer_uploaded:
+            return
+
+        with open(os.path.join(os.path.dirname(__file__), VIEWER_KEY), "rb") as f:
+            body = f.read()
+        # the ETag is not the MD5 of objects encrypted with KMS, so the digest
+        # of the uploaded viewer is kept in its metadata
+        digest = hashlib.md5(body).hexdigest()
 
         try:
-            # Update the record in the DynamoDB table
-            # existing_attributes = record['dynamodb']['NewImage']
-            
-            dynamodb = boto3.resource('dynamodb')
-            table = dynamodb.Table(RECORDS_TABLE)
-
-            # Create an update expression to add a new attribute to the record
-            update_expression = 'SET #new_attr_name = :new_attr_value'
-            expression_attribute_names = {'#new_attr_name': 'map'}
-            expression_attribute_values = {':new_attr_value': map_filename}
-            
-            
-            # Update the record in DynamoDB
-            response = table.update_item(
-                Key={'filename': filename},
-                UpdateExpression=update_expression,
-                ExpressionAttributeNames=expression_attribute_names,
-                ExpressionAttributeValues=expression_attribute_values
+            uploaded = s3.head_object(Bucket=MAPS_BUCKET, Key=VIEWER_KEY)['Metadata'].get('md5')
+        except s3.exceptions.ClientError:
+            uploaded = None
+
+        if uploaded != digest:
+            s3.put_object(
+                Bucket=MAPS_BUCKET,
+                Key=VIEWER_KEY,
+                Body=body,
+                ContentType='text/html; charset=utf-8',
+                Metadata={'md5': digest}
             )
+            print(f"Uploaded {VIEWER_KEY} to destination S3 bucket.")
+
+        viewer_uploaded = True
+
+
+def content_key(etag):
+    """
+    Cache key of the artifacts generated from a CSV object. Identical uploads
+    have the same ETag, and the settings that change the artifacts are part
+    of the key so that changing them does not reuse stale maps.
+    """
+    parts = [
+        etag.strip('"'),
+        MAP_FORMAT,
+        f"{SIMPLIFY_TOLERANCE_M:g}",
+        f"{FLEET_TOLERANCE_M:g}",
+        COLUMNAR_FORMAT or '-',
+        str(GEOHASH_PRECISION),
+    ]
+    # the levels and chunks of the manifest depend on the LOD settings
+    if MAP_FORMAT == 'lod':
+        parts += [f"{LOD_FACTOR:g}", str(LOD_MIN_POINTS), str(LOD_CHUNK_POINTS)]
+    return '#'.join(parts)
+
+
+def content_lock(key):
+    with content_locks_lock:
+        return content_locks.setdefault(key, threading.Lock())
+
+
+def cached_artifacts(key):
+    response = dynamodb_table(MAP_CACHE_TABLE).get_item(Key={'content_key': key})
+    return response.get('Item')
+
+
+def cache_artifacts(key, filename, attributes, cells, route):
+    """Remember the artifacts of a CSV content, the first writer wins."""
+    try:
+        dynamodb_table(MAP_CACHE_TABLE).put_item(
+            Item={
+                'content_key': key,
+                'filename': filename,
+                'attributes': attributes,
+                'cells': cells,
+                'route': route,
+            },
+            ConditionExpression='attribute_not_exists(content_key)'
+        )
+    except Exception as e:
+        # the map is generated either way, a duplicate of it is just rendered again
+        print(f"Could not cache the artifacts of {filename}.")
+        print(e)
+
+
+def summarize_track(track):
+    """
+    What the map and the record are built from: the track simplified for the
+    map and for the fleet file, its statistics and its geohash cells.
+    """
+    lat = track['lat']
+    lon = track['lon']
+    # Drop the points that do not change the drawn route by more than the tolerance
+    keep = simplify(lat, lon, SIMPLIFY_TOLERANCE_M)
+    fleet_keep = simplify(lat, lon, FLEET_TOLERANCE_M)
+
+    return {
+        'lat': lat[keep],
+        'lon': lon[keep],
+        'fleet_lat': lat[fleet_keep],
+        'fleet_lon': lon[fleet_keep],
+        'stats': track_stats(track),
+        'cells': geohash_cells(lat, lon, GEOHASH_PRECISION),
+    }
+
+
+def summarize_chunk(filename, header, start, end, etag):
+    """Summary of the rows in the bytes [start, end) of a CSV file, as JSON for the coordinator."""
+    body = read_range(s3, CSV_BUCKET, filename, start, end, etag, prefix=header.encode('utf-8'))
+    summary = summarize_track(read_track(body, end - start))
+
+    for name in ('lat', 'lon', 'fleet_lat', 'fleet_lon'):
+        summary[name] = summary[name].round(7).tolist()
+    return summary
+
+
+def chunk_response(chunk, summary):
+    """The summary of a chunk, or the key it was written to when it is too large for the invoke response."""
+    body = json.dumps(summary, separators=(',', ':')).encode('utf-8')
+    if len(body) <= CHUNK_PAYLOAD_BYTES:
+        return summary
+
+    etag = chunk['etag'].strip('"')
+    key = f"fanout/{etag}/{chunk['start']}-{chunk['end']}.json"
+    s3.put_object(Bucket=MAPS_BUCKET, Key=key, Body=body, ContentType='application/json')
+    return {'summary_key': key}
+
+
+def invoke_chunk(lambda_client, chunk):
+    response = lambda_client.invoke(
+        FunctionName=CHUNK_FUNCTION,
+        Payload=json.dumps({'chunk': chunk})
+    )
+    payload = json.loads(response['Payload'].read())
+    if 'FunctionError' in response:
+        raise RuntimeError(f"Chunk {chunk['start']}-{chunk['end']} failed: {payload.get('errorMessage')}")
+
+    if 'summary_key' in payload:
+        key = payload['summary_key']
+        payload = json.loads(s3.get_object(Bucket=MAPS_BUCKET, Key=key)['Body'].read())
+        s3.delete_object(Bucket=MAPS_BUCKET, Key=key)
+    return payload
+
+
+def summarize_fanout(filename, size, etag):
+    """
+    Summarize a large CSV file chunk by chunk in parallel and stitch the
+    chunks together. Every chunk keeps its first and last point, so the
+    joined route stays within the tolerance and the distance across the
+    joins is added to the statistics.
+    """
+    # the chunk size bounds the memory of a worker, the number of workers the
+    # concurrency a single file takes from the account
+    count = max(-(-size // FANOUT_CHUNK_BYTES), 1)
+    header, ranges = split_rows(s3, CSV_BUCKET, filename, size, count, etag)
+    chunks = [
+        {'filename': filename, 'header': header.decode('utf-8'), 'start': start, 'end': end, 'etag': etag}
+        for start, end in ranges
+    ]
+    workers = min(len(chunks), FANOUT_WORKERS)
+    print(f"Splitting {filename}, {size} bytes, into {len(chunks)} chunks for {workers} workers.")
+
+    if FANOUT_MODE == 'process':
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            summaries = list(executor.map(lambda_chunk_handler, chunks))
+    else:
+        # a worker may take as long as the timeout of the chunk function
+        lambda_client = boto3.client('lambda', config=Config(read_timeout=900, retries={'max_attempts': 0}))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            summaries = list(executor.map(lambda chunk: invoke_chunk(lambda_client, chunk), chunks))
+
+    def joined(name):
+        return np.concatenate([np.asarray(summary[name], dtype=np.float64) for summary in summaries])
 
-            # Log the response from the update operation
-            print(f"Updated record {filename}: {response}")
+    return {
+        'lat': joined('lat'),
+        'lon': joined('lon'),
+        'fleet_lat': joined('fleet_lat'),
+        'fleet_lon': joined('fleet_lon'),
+        'stats': merge_stats([(summary['stats'], summary['lat'], summary['lon']) for summary in summaries]),
+        'cells': sorted(set().union(*(summary['cells'] for summary in summaries))),
+    }
+
+
+def generate_artifacts(filename, vin, date, etag, size):
+    """
+    Parse the CSV file, upload its map and columnar sidecar. Returns the record
+    attributes, the geohash cells and the encoded fleet route of the track.
+    """
+    track = None
+
+    try:
+        if FANOUT_BYTES and size > FANOUT_BYTES:
+            summary = summarize_fanout(filename, size, etag)
+        else:
+            # Stream the CSV file containing the coordinates into the parser,
+            # IfMatch makes sure it is still the content the cache key was built from
+            if csv_cache:
+                body = csv_cache.open(s3, CSV_BUCKET, filename, etag, size)
+            else:
+                body = s3.get_object(Bucket=CSV_BUCKET, Key=filename, IfMatch=etag)['Body']
+            try:
+                track = read_track(body, size, columnar=bool(COLUMNAR_FORMAT))
+            finally:
+                body.close()
+            summary = summarize_track(track)
+
+        stats = summary['stats']
+        lat = summary['lat']
+        lon = summary['lon']
+        print(f"Simplified {filename} from {stats['points']} points to {len(lat)}.")
+
+    except Exception as e:
+        print(f"Error reading the CSV file {filename}.")
+        print(e)
+        raise
+
+    try:
+        # Render the map in memory and compress it for the upload
+        map_filename, rendered, content_type, parts = RENDERERS[MAP_FORMAT](filename, lat, lon)
+        map_body = gzip.compress(rendered)
+        print(f"Generated the map {map_filename}, {len(rendered)} bytes, {len(map_body)} compressed, "
+              f"{len(parts)} parts.")
+
+    except Exception as e:
+        print(f"Error rendering the map file for {filename}.")
+        print(e)
+        raise
+
+    try:
+        # The parts go first, so that the map never points at missing objects
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(
+                lambda part: upload_compressed(part[0], gzip.compress(part[1]), part[2]), parts
+            ))
+        upload_compressed(map_filename, map_body, content_type)
+        print(f"Uploaded the map {map_filename} to destination S3 bucket.")
+
+        if MAP_FORMAT != 'html' or FLEET_MAPS:
+            upload_viewer()
+
+    except Exception as e:
+        print(f"Error uploading the map {map_filename} to S3 bucket.")
+        print(e)
+        raise
+
+    # Distance, bounding box, time and elevation range of the run,
+    # so that consumers of the record do not need to fetch the CSV
+    print(f"Track statistics for {filename}: {stats}")
+
+    attributes = {
+        'map': map_filename,
+        'simplified_points': len(lat),
+        **to_dynamodb(stats),
+    }
+
+    # the full track of a file that was split into chunks is never in memory
+    if COLUMNAR_FORMAT and track is not None:
+        try:
+            # Keep a typed, column-pruned copy of the track for analytics
+            columnar_filename = columnar_key(filename, vin, date, COLUMNAR_FORMAT)
+            s3.put_object(
+                Bucket=MAPS_BUCKET,
+                Key=columnar_filename,
+                Body=write_columnar(track, COLUMNAR_FORMAT),
+                ContentType=CONTENT_TYPES[COLUMNAR_FORMAT]
+            )
+            attributes['columnar'] = columnar_filename
+            print(f"Uploaded the columnar file {columnar_filename} to destination S3 bucket.")
 
         except Exception as e:
-            print("Could not update the test record.")
+            print(f"Error writing the columnar file for {filename}.")
             print(e)
             raise
-            
+
+    route = encode_polyline(summary['fleet_lat'], summary['fleet_lon']).decode('ascii')
+
+    return attributes, summary['cells'], route
+
+
+def copy_columnar(source_key, filename, vin, date):
+    """
+    Copy the columnar file of the cached content to the vin= and date=
+    partition of the duplicate, so that every partition only holds its own runs.
+    """
+    columnar_filename = columnar_key(filename, vin, date, COLUMNAR_FORMAT)
+    if columnar_filename != source_key:
+        s3.copy_object(
+            Bucket=MAPS_BUCKET,
+            Key=columnar_filename,
+            CopySource={'Bucket': MAPS_BUCKET, 'Key': source_key}
+        )
+        print(f"Copied the columnar file {source_key} to {columnar_filename}.")
+    return columnar_filename
+
+
+def index_run(filename, vin, date, map_filename, cells):
+    """
+    Index the run under every cell it passes through, so that runs near
+    a location are found by querying the cells instead of scanning.
+    """
+    try:
+        with dynamodb_table(GEO_INDEX_TABLE).batch_writer(overwrite_by_pkeys=['cell_prefix', 'cell_run']) as batch:
+            for cell in cells:
+                batch.put_item(Item={
+                    'cell_prefix': cell[:GEOHASH_PREFIX_PRECISION],
+                    'cell_run': f"{cell}#{filename}",
+                    'cell': cell,
+                    'filename': filename,
+                    'currentVin': vin,
+                    'date': date,
+                    'map': map_filename,
+                })
+        print(f"Indexed {filename} under {len(cells)} geohash cells.")
 
     except Exception as e:
+        print(f"Could not index the run {filename}.")
         print(e)
         raise
 
-    return 0
\ No newline at end of file
+
+def add_fleet_run(filename, vin, date, attributes, route):
+    """Add the run to the routes of its VIN, without reading any other run's CSV."""
+    run = {
+        'filename': filename,
+        'date': date,
+        'map': attributes['map'],
+        'distance_m': float(attributes.get('distance_m', 0)),
+        'route': route,
+    }
+
+    try:
+        fleet_filename, runs = add_run(s3, MAPS_BUCKET, vin, run)
+        print(f"Added {filename} to {fleet_filename}, {runs} runs in {date[:7]}.")
+        return fleet_filename
+
+    except Exception as e:
+        print(f"Could not add {filename} to the fleet map of {vin}.")
+        print(e)
+        raise
+
+
+def update_record(filename, attributes):
+    try:
+        # Create an update expression to add the new attributes to the record
+        update_expression = 'SET ' + ', '.join(f'#attr{i} = :value{i}' for i in range(len(attributes)))
+        expression_attribute_names = {f'#attr{i}': name for i, name in enumerate(attributes)}
+        expression_attribute_values = {f':value{i}': value for i, value in enumerate(attributes.values())}
+
+        # Update the record in DynamoDB
+        response = dynamodb_table(RECORDS_TABLE).update_item(
+            Key={'filename': filename},
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames=expression_attribute_names,
+            ExpressionAttributeValues=expression_attribute_values
+        )
+
+        # Log the response from the update operation
+        print(f"Updated record {filename}: {response}")
+
+    except Exception as e:
+        print(f"Could not update the test record {filename}.")
+        print(e)
+        raise
+
+
+def generate_map(filename, vin, date):
+    print(f"Processing file {filename}")
+
+    head = s3.head_object(Bucket=CSV_BUCKET, Key=filename)
+    etag = head['ETag']
+    size = head['ContentLength']
+
+    if not MAP_CACHE_TABLE:
+        attributes, cells, route = generate_artifacts(filename, vin, date, etag, size)
+
+    else:
+        # Re-uploads and copies of a file point at the artifacts of the first
+        # upload of the content, without downloading or rendering it again
+        key = content_key(etag)
+
+        with content_lock(key):
+            cached = cached_artifacts(key)
+            if cached:
+                attributes = dict(cached['attributes'])
+                cells = cached['cells']
+                route = cached['route']
+                if cached['filename'] != filename:
+                    attributes['duplicate_of'] = cached['filename']
+                if 'columnar' in attributes:
+                    attributes['columnar'] = copy_columnar(attributes['columnar'], filename, vin, date)
+                print(f"{filename} has the same content as {cached['filename']}, reusing the map {attributes['map']}.")
+            else:
+                attributes, cells, route = generate_artifacts(filename, vin, date, etag, size)
+                cache_artifacts(key, filename, attributes, cells, route)
+
+    index_run(filename, vin, date, attributes['map'], cells)
+    attributes['geohash_cells'] = len(cells)
+
+    if FLEET_MAPS:
+        attributes['fleet_map'] = add_fleet_run(filename, vin, date, attributes, route)
+
+    update_record(filename, attributes)
+
+
+def lambda_chunk_handler(chunk):
+    return summarize_chunk(**chunk)
+
+
+def lambda_handler(event, context):
+    # a chunk of a large file, invoked by the coordinating invocation
+    if 'chunk' in event:
+        return chunk_response(event['chunk'], lambda_chunk_handler(event['chunk']))
+
+    inserts = []
+    for record in event['Records']:
+        if record['eventName'] == 'INSERT':
+            image = record['dynamodb']['NewImage']
+            # a single record without them would otherwise fail the whole batch
+            if 'currentVin' not in image or 'date' not in image:
+                print(f"Skipping {image['filename']['S']} without a VIN or date.")
+                continue
+            inserts.append((
+                record['dynamodb']['SequenceNumber'],
+                image['filename']['S'],
+                image['currentVin']['S'],
+                image['date']['S']
+            ))
+
+    # Generate the maps of the batch in parallel. Failed records are reported
+    # back to the event source mapping, which retries the batch from the first
+    # failed sequence number instead of from the start.
+    failures = []
+    with ThreadPoolExecutor(max_workers=MAP_WORKERS) as executor:
+        futures = [(sequence_number, filename, executor.submit(generate_map, filename, vin, date))
+                   for sequence_number, filename, vin, date in inserts]
+
+        for sequence_number, filename, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Could not generate the map for {filename}: {e}")
+                failures.append({'itemIdentifier': sequence_number})
+
+    content_locks.clear()
+    if csv_cache:
+        print(f"CSV cache: {csv_cache.stats()}")
+    print(f"Generated {len(inserts) - len(failures)} of {len(inserts)} maps.")
+
+    return {'batchItemFailures': failures}
@@ -0,0 +1,89 @@
+import json
+import math
+
+import numpy as np
+
+from encoding import encode_polyline
+from geometry import simplify
+
+# metres per pixel at zoom 0 on the equator of a 256 pixel Web Mercator tile
+METRES_PER_PIXEL_Z0 = 156543.03
+MAX_ZOOM = 22
+
+
+def level_tolerances(lat, lon, base_tolerance, factor, min_points, max_levels):
+    """
+    Tolerance pyramid: the base level is the route as simplified for the map,
+    every coarser level simplifies the previous one with factor times its
+    tolerance, until a level is small enough to draw the whole track.
+    Returns [(tolerance, lat, lon)] from the finest to the coarsest level.
+    """
+    levels = [(base_tolerance, lat, lon)]
+
+    while len(levels[-1][1]) > min_points and len(levels) < max_levels:
+        tolerance, level_lat, level_lon = levels[-1]
+        tolerance = max(tolerance, 1.0) * factor
+        keep = simplify(level_lat, level_lon, tolerance)
+        levels.append((tolerance, level_lat[keep], level_lon[keep]))
+
+    return levels
+
+
+def max_zoom(tolerance, latitude):
+    """Highest zoom at which the tolerance is still within a pixel."""
+    metres_per_pixel = METRES_PER_PIXEL_Z0 * math.cos(math.radians(latitude))
+    return max(0, min(MAX_ZOOM, int(math.floor(math.log2(metres_per_pixel / tolerance)))))
+
+
+def bounds(lat, lon):
+    """Bounding box rounded to about a metre, the viewer pads it anyway."""
+    return [[round(float(np.min(lat)), 5), round(float(np.min(lon)), 5)],
+            [round(float(np.max(lat)), 5), round(float(np.max(lon)), 5)]]
+
+
+def build_lod(prefix, lat, lon, base_tolerance, factor=4.0, min_points=1000, chunk_points=2000, max_levels=8):
+    """
+    Split the route into levels of detail, each cut into chunks of at most
+    chunk_points consecutive points that share their end points, so the
+    viewer draws a level without gaps from only the chunks in view.
+    Returns the manifest and the [(key, body)] of the polyline encoded chunks.
+    """
+    if len(lat) == 0:
+        return {'bounds': None, 'points': 0, 'levels': []}, []
+
+    latitude = float(np.mean(lat))
+    levels = level_tolerances(lat, lon, base_tolerance, factor, min_points, max_levels)
+
+    manifest = {'bounds': bounds(lat, lon), 'points': len(lat), 'levels': []}
+    chunks = []
+    min_zoom = 0
+
+    # coarsest level first, each level is drawn up to the zoom of the next finer one
+    for number, (tolerance, level_lat, level_lon) in reversed(list(enumerate(levels))):
+        level_max_zoom = MAX_ZOOM if number == 0 else max(min_zoom, max_zoom(tolerance, latitude))
+        level = {
+            'tolerance_m': tolerance,
+            'min_zoom': min_zoom,
+            'max_zoom': level_max_zoom,
+            'points': len(level_lat),
+            'chunks': [],
+        }
+
+        for start in range(0, max(len(level_lat) - 1, 1), chunk_points):
+            end = min(start + chunk_points + 1, len(level_lat))
+            key = f"{prefix}/{number}-{start // chunk_points}.polyline"
+            chunks.append((key, encode_polyline(level_lat[start:end], level_lon[start:end])))
+            level['chunks'].append({
+                'key': key.rsplit('/', 1)[-1],
+                'bounds': bounds(level_lat[start:end], level_lon[start:end]),
+                'points': end - start,
+            })
+
+        manifest['levels'].append(level)
+        min_zoom = level_max_zoom + 1
+
+    return manifest, chunks
+
+
+def encode_manifest(manifest):
+    return json.dumps(manifest, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,159 @@
+import codecs
+import csv
+from array import array
+
+import numpy as np
+
+# column kinds understood by the parsers
+FLOAT = 'float'
+TIME = 'time'
+
+# time fields are converted in blocks of this many rows, instead of keeping every string
+TIME_BLOCK_ROWS = 8192
+
+
+def parse_times(values):
+    """
+    Convert GPX timestamps such as 2023-04-15T10:00:00Z to datetime64[ms] in UTC.
+    Empty or unreadable values become NaT.
+    """
+    values = [value[:-1] if value.endswith('Z') else value for value in values]
+    try:
+        return np.array(values, dtype='datetime64[ms]')
+    except ValueError:
+        times = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ms]')
+        for i, value in enumerate(values):
+            try:
+                times[i] = np.datetime64(value, 'ms')
+            except ValueError:
+                pass
+        return times
+
+
+def missing_column(kind, length, dtype):
+    if kind == TIME:
+        return np.full(length, np.datetime64('NaT'), dtype='datetime64[ms]')
+    return np.full(length, np.nan, dtype=dtype)
+
+
+def read_columns_csv(body, columns, required, dtype):
+    """
+    Parse columns from a file-like CSV body with the stdlib csv module.
+    columns maps the column names to FLOAT or TIME. Rows are decoded as they
+    stream in and only the requested fields are converted, empty fields and
+    optional columns missing from the header become NaN / NaT.
+    Returns {column: ndarray}.
+    """
+    reader = csv.reader(codecs.getreader('utf-8-sig')(body))
+    header = next(reader, [])
+
+    missing = [column for column in required if column not in header]
+    if missing:
+        raise ValueError(f"Columns expected but not found: {missing}")
+
+    present = [column for column in columns if column in header]
+    indices = [header.index(column) for column in present]
+    # datetime64[ms] values are collected as their int64 milliseconds
+    values = [array('d' if columns[column] == FLOAT else 'q') for column in present]
+    pending = [[] for column in present]
+    nan = float('nan')
+
+    def convert_times():
+        for column, column_values, fields in zip(present, values, pending):
+            if columns[column] == TIME and fields:
+                column_values.frombytes(parse_times(fields).tobytes())
+                fields.clear()
+
+    for rows, row in enumerate(reader, 1):
+        for column, index, column_values, fields in zip(present, indices, values, pending):
+            field = row[index] if index < len(row) else ''
+            if columns[column] == FLOAT:
+                column_values.append(float(field) if field else nan)
+            else:
+                fields.append(field)
+        if rows % TIME_BLOCK_ROWS == 0:
+            convert_times()
+    convert_times()
+
+    parsed = {}
+    for column, column_values in zip(present, values):
+        if columns[column] == FLOAT:
+            parsed[column] = np.frombuffer(column_values, dtype=np.float64).astype(dtype)
+        else:
+            parsed[column] = np.frombuffer(column_values, dtype='datetime64[ms]')
+
+    length = len(values[0]) if values else 0
+    for column in columns:
+        if column not in parsed:
+            parsed[column] = missing_column(columns[column], length, dtype)
+
+    return parsed
+
+
+# array typecodes of the float dtypes, for columns collected chunk by chunk
+TYPECODES = {'float32': 'f', 'float64': 'd'}
+
+
+def read_chunks_pandas(chunks, columns, dtype):
+    """
+    Collect the columns of the DataFrame chunks into arrays as they arrive,
+    times converted chunk by chunk, so no more than one chunk is in memory
+    next to the parsed columns. Returns the names of the columns in the file
+    and {column: ndarray}.
+    """
+    present = []
+    values = {}
+
+    for chunk in chunks:
+        if not values:
+            present = list(chunk.columns)
+            # datetime64[ms] values are collected as their int64 milliseconds
+            values = {column: array(TYPECODES[dtype] if columns[column] == FLOAT else 'q') for column in present}
+        for column in present:
+            if columns[column] == FLOAT:
+                values[column].frombytes(chunk[column].to_numpy(dtype=dtype).tobytes())
+            else:
+                values[column].frombytes(parse_times(chunk[column].tolist()).tobytes())
+
+    return present, {
+        column: np.frombuffer(column_values, dtype=dtype if columns[column] == FLOAT else 'datetime64[ms]')
+        for column, column_values in values.items()
+    }
+
+
+def read_columns_pandas(body, columns, required, dtype, chunk_rows=0):
+    """
+    Parse columns from a file-like CSV body with pandas, with the same
+    arguments and result as read_columns_csv. The other columns are
+    skipped by the parser. With chunk_rows the file is parsed that many
+    rows at a time.
+    """
+    import pandas as pd
+
+    options = {
+        'usecols': lambda column: column in columns,
+        'dtype': {column: dtype if kind == FLOAT else str for column, kind in columns.items()},
+        'keep_default_na': False,
+        'na_values': {column: [''] for column, kind in columns.items() if kind == FLOAT},
+    }
+
+    if chunk_rows:
+        present, values = read_chunks_pandas(pd.read_csv(body, chunksize=chunk_rows, **options), columns, dtype)
+    else:
+        df = pd.read_csv(body, **options)
+        present = list(df.columns)
+        values = {
+            column: df[column].to_numpy() if columns[column] == FLOAT else parse_times(df[column].tolist())
+            for column in present
+        }
+
+    missing = [column for column in required if column not in present]
+    if missing:
+        raise ValueError(f"Columns expected but not found: {missing}")
+
+    length = len(next(iter(values.values()))) if values else 0
+    parsed = {}
+    for column, kind in columns.items():
+        parsed[column] = values[column] if column in values else missing_column(kind, length, dtype)
+
+    return parsed
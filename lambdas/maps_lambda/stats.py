@@ -0,0 +1,106 @@
+from decimal import Decimal
+
+import numpy as np
+
+from geometry import EARTH_RADIUS_M
+
+
+def haversine_distances(lat, lon):
+    """Great-circle distances in metres between consecutive points."""
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+
+    a = (np.sin(np.diff(lat) / 2) ** 2
+         + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def track_stats(track):
+    """
+    Summary of a parsed track, ready to be stored as record attributes.
+    Statistics that cannot be computed, such as the duration of a track
+    without timestamps, are left out.
+    """
+    lat = track['lat']
+    lon = track['lon']
+
+    if len(lat) == 0:
+        return {'points': 0}
+
+    stats = {
+        'points': len(lat),
+        'distance_m': float(np.sum(haversine_distances(lat, lon))),
+        'min_lat': float(np.min(lat)),
+        'max_lat': float(np.max(lat)),
+        'min_lon': float(np.min(lon)),
+        'max_lon': float(np.max(lon)),
+    }
+
+    ele = track.get('ele')
+    if ele is not None and not np.all(np.isnan(ele)):
+        stats['min_ele'] = float(np.nanmin(ele))
+        stats['max_ele'] = float(np.nanmax(ele))
+
+    times = track.get('time')
+    if times is not None:
+        times = times[~np.isnat(times)]
+        if len(times):
+            start, end = times.min(), times.max()
+            stats['start_time'] = f"{start}Z"
+            stats['end_time'] = f"{end}Z"
+            stats['duration_s'] = (end - start) / np.timedelta64(1, 's')
+
+    return stats
+
+
+# how the statistics of consecutive chunks of a track combine
+MERGED_STATS = {
+    'min_lat': min,
+    'max_lat': max,
+    'min_lon': min,
+    'max_lon': max,
+    'min_ele': min,
+    'max_ele': max,
+    'start_time': min,
+    'end_time': max,
+}
+
+
+def merge_stats(chunks):
+    """
+    Statistics of a track from the statistics of its consecutive chunks.
+    chunks are (stats, lat, lon) with at least the first and last point of
+    every chunk in lat and lon, the distance is added up across the joins.
+    """
+    chunks = [(stats, lat, lon) for stats, lat, lon in chunks if stats['points']]
+    if not chunks:
+        return {'points': 0}
+
+    lat_ends = np.array([[lat[0], lat[-1]] for _, lat, _ in chunks])
+    lon_ends = np.array([[lon[0], lon[-1]] for _, _, lon in chunks])
+    joins = haversine_distances(lat_ends.ravel()[1:-1], lon_ends.ravel()[1:-1])[::2]
+
+    stats = {
+        'points': sum(chunk['points'] for chunk, _, _ in chunks),
+        'distance_m': float(sum(chunk['distance_m'] for chunk, _, _ in chunks) + np.sum(joins)),
+    }
+    for name, merge in MERGED_STATS.items():
+        values = [chunk[name] for chunk, _, _ in chunks if name in chunk]
+        if values:
+            stats[name] = merge(values)
+
+    # the timestamps are all formatted the same way, so they compare as strings
+    if 'start_time' in stats:
+        start = np.datetime64(stats['start_time'][:-1])
+        end = np.datetime64(stats['end_time'][:-1])
+        stats['duration_s'] = float((end - start) / np.timedelta64(1, 's'))
+
+    return stats
+
+
+def to_dynamodb(stats):
+    """DynamoDB numbers have to be Decimal, rounded to keep the items small."""
+    return {
+        name: Decimal(str(round(value, 6))) if isinstance(value, float) else value
+        for name, value in stats.items()
+    }
@@ -0,0 +1,191 @@
+import os
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+RECORDS_TABLE = os.environ.get('RECORDS_TABLE')
+VIN_DATE_INDEX = os.environ.get('VIN_DATE_INDEX', 'VinDateIndex')
+VIN_SUMMARY_TABLE = os.environ.get('VIN_SUMMARY_TABLE')
+
+dynamodb = boto3.resource('dynamodb')
+records_table = dynamodb.Table(RECORDS_TABLE)
+summary_table = dynamodb.Table(VIN_SUMMARY_TABLE)
+
+
+def conditional_update(vin, **update):
+    """UpdateItem of the VIN's summary, returns False when its condition does not hold."""
+    try:
+        summary_table.update_item(Key={'currentVin': vin}, **update)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def map_key(date, filename):
+    # orders the runs of a VIN by date, runs of the same day by filename
+    return f"{date}#{filename}"
+
+
+def add_run(vin, date):
+    """Widen the date range of the VIN to the date of a new run."""
+    conditional_update(vin,
+        UpdateExpression='SET first_date = :date',
+        ConditionExpression='attribute_not_exists(first_date) OR first_date > :date',
+        ExpressionAttributeValues={':date': date}
+    )
+    conditional_update(vin,
+        UpdateExpression='SET last_date = :date',
+        ConditionExpression='attribute_not_exists(last_date) OR last_date < :date',
+        ExpressionAttributeValues={':date': date}
+    )
+
+
+def count_runs(vin, count):
+    if count > 0:
+        summary_table.update_item(
+            Key={'currentVin': vin},
+            UpdateExpression='ADD run_count :count',
+            ExpressionAttributeValues={':count': count}
+        )
+        return
+
+    # runs recorded before the table existed were never counted
+    conditional_update(vin,
+        UpdateExpression='ADD run_count :count',
+        ConditionExpression='run_count >= :removed',
+        ExpressionAttributeValues={':count': count, ':removed': -count}
+    )
+
+
+def set_latest_map(vin, date, filename, map_filename):
+    """Point latest_map at the map of the run, unless a later run already has a map."""
+    conditional_update(vin,
+        UpdateExpression='SET latest_map = :map, latest_map_file = :filename, latest_map_key = :key',
+        ConditionExpression='attribute_not_exists(latest_map_key) OR latest_map_key <= :key',
+        ExpressionAttributeValues={
+            ':map': map_filename,
+            ':filename': filename,
+            ':key': map_key(date, filename)
+        }
+    )
+
+
+def remaining_runs(vin, removed_filename, forward, with_map=False):
+    """
+    Runs of the VIN from VinDateIndex, earliest or latest first, without the
+    removed one that the eventually consistent index may still return.
+    """
+    query = {
+        'IndexName': VIN_DATE_INDEX,
+        'KeyConditionExpression': Key('currentVin').eq(vin),
+        'ProjectionExpression': 'filename, #date, #map',
+        'ExpressionAttributeNames': {'#date': 'date', '#map': 'map'},
+        'ScanIndexForward': forward,
+    }
+    if with_map:
+        query['FilterExpression'] = Attr('map').exists()
+
+    while True:
+        response = records_table.query(**query)
+        for item in response['Items']:
+            if item['filename'] != removed_filename:
+                yield item
+        if 'LastEvaluatedKey' not in response:
+            return
+        query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def replace_bound(vin, name, removed_date, removed_filename, forward):
+    """
+    Move first_date or last_date of the VIN to the next remaining run once the
+    run it was taken from is removed. A run added in the meantime already
+    moved it, the condition keeps that date.
+    """
+    run = next(remaining_runs(vin, removed_filename, forward), None)
+    if run:
+        update = {
+            'UpdateExpression': f'SET {name} = :date',
+            'ExpressionAttributeValues': {':date': run['date'], ':removed': removed_date},
+        }
+    else:
+        update = {
+            'UpdateExpression': f'REMOVE {name}',
+            'ExpressionAttributeValues': {':removed': removed_date},
+        }
+    conditional_update(vin, ConditionExpression=f'{name} = :removed', **update)
+
+
+def remove_run(vin, date, filename):
+    """Replace the dates and map of the VIN that were taken from a removed run."""
+    summary = summary_table.get_item(Key={'currentVin': vin}, ConsistentRead=True).get('Item', {})
+
+    if summary.get('first_date') == date:
+        replace_bound(vin, 'first_date', date, filename, forward=True)
+    if summary.get('last_date') == date:
+        replace_bound(vin, 'last_date', date, filename, forward=False)
+
+    if summary.get('latest_map_file') == filename:
+        run = next(remaining_runs(vin, filename, forward=False, with_map=True), None)
+        if run:
+            update = {
+                'UpdateExpression': 'SET latest_map = :map, latest_map_file = :filename, latest_map_key = :key',
+                'ExpressionAttributeValues': {
+                    ':map': run['map'],
+                    ':filename': run['filename'],
+                    ':key': map_key(run['date'], run['filename']),
+                    ':removed': filename
+                },
+            }
+        else:
+            update = {
+                'UpdateExpression': 'REMOVE latest_map, latest_map_file, latest_map_key',
+                'ExpressionAttributeValues': {':removed': filename},
+            }
+        conditional_update(vin, ConditionExpression='latest_map_file = :removed', **update)
+
+
+def apply_record(record):
+    event_name = record['eventName']
+    image = record['dynamodb'].get('OldImage' if event_name == 'REMOVE' else 'NewImage', {})
+
+    if 'currentVin' not in image or 'date' not in image:
+        print(f"Skipping {event_name} of {record['dynamodb']['Keys']['filename']['S']} without a VIN or date.")
+        return
+
+    vin = image['currentVin']['S']
+    date = image['date']['S']
+    filename = image['filename']['S']
+
+    if event_name == 'REMOVE':
+        remove_run(vin, date, filename)
+        count_runs(vin, -1)
+        return
+
+    # MapsLambda adds the map to the record after it was inserted
+    if 'map' in image:
+        set_latest_map(vin, date, filename, image['map']['S'])
+    if event_name == 'INSERT':
+        add_run(vin, date)
+        count_runs(vin, 1)
+
+
+def lambda_handler(event, context):
+    # The run counter is not idempotent. Every record is applied with its
+    # conditional updates first and the counter last, in order, and the batch
+    # stops at the first failure. The event source mapping retries from that
+    # record, so no run is counted twice.
+    records = event['Records']
+    for position, record in enumerate(records):
+        try:
+            apply_record(record)
+        except Exception as e:
+            print(f"Could not apply {record['eventName']} {record['dynamodb']['SequenceNumber']}: {e}")
+            print(f"Applied {position} of {len(records)} records.")
+            return {'batchItemFailures': [
+                {'itemIdentifier': failed['dynamodb']['SequenceNumber']} for failed in records[position:]
+            ]}
+
+    print(f"Applied {len(records)} records.")
+    return {'batchItemFailures': []}
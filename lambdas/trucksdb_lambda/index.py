@@ -1,12 +1,114 @@
 import json
 import os
+import random
 import re
+import time
 import boto3
 
 dynamodb = boto3.resource('dynamodb')
+apigateway = boto3.client('apigateway')
 TABLE_NAME = os.environ.get('TRUCKS_TABLE_NAME')
 
+# DynamoDB limit of items per BatchWriteItem request
+BATCH_WRITE_SIZE = 25
+MAX_BATCH_ATTEMPTS = 5
+
+
+def flush_cache(event):
+    """
+    Drop the cached responses of the stage that received the write,
+    so that GET /alltrucks returns the new truck right away.
+    """
+    request_context = event.get('requestContext', {})
+    try:
+        apigateway.flush_stage_cache(
+            restApiId=request_context['apiId'],
+            stageName=request_context['stage']
+        )
+        print(f"Flushed the cache of stage {request_context['stage']}")
+    except Exception as e:
+        # the cached list catches up when its TTL expires
+        print(f"Could not flush the stage cache: {e}")
+
+
+def backoff(attempt):
+    # exponential backoff with full jitter
+    time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+
+def batch_write(items):
+    """
+    Put the items with BatchWriteItem in chunks of 25, retrying the
+    unprocessed ones with backoff. Returns the currentVin of the items
+    that could not be written.
+    """
+    failed = []
+
+    for start in range(0, len(items), BATCH_WRITE_SIZE):
+        requests = [{'PutRequest': {'Item': item}} for item in items[start:start + BATCH_WRITE_SIZE]]
+
+        for attempt in range(MAX_BATCH_ATTEMPTS):
+            try:
+                response = dynamodb.batch_write_item(RequestItems={TABLE_NAME: requests})
+            except Exception as e:
+                # the chunk is reported as failed, the other chunks are still written
+                print(f"Could not write {len(requests)} trucks: {e}")
+                break
+            requests = response.get('UnprocessedItems', {}).get(TABLE_NAME, [])
+            if not requests:
+                break
+            print(f"{len(requests)} unprocessed trucks, retrying")
+            backoff(attempt)
+
+        failed.extend(request['PutRequest']['Item']['currentVin'] for request in requests)
+
+    return failed
+
+
+def add_trucks(event):
+    """
+    Bulk registration, the body is an array of trucks. A currentVin that
+    appears more than once is written once, with the last of its trucks,
+    like a sequence of single writes would leave it.
+    Returns the result of every truck in the order of the request.
+    """
+    payload = json.loads(event['body'])
+    print(f'Received {len(payload)} trucks')
+
+    last = {truck['currentVin']: i for i, truck in enumerate(payload)}
+    failed = set(batch_write([payload[i] for i in sorted(last.values())]))
+
+    results = []
+    for i, truck in enumerate(payload):
+        vin = truck['currentVin']
+        if last[vin] != i:
+            status = 'superseded'
+        elif vin in failed:
+            status = 'failed'
+        else:
+            status = 'saved'
+        results.append({'currentVin': vin, 'status': status})
+
+    if len(failed) < len(last):
+        flush_cache(event)
+
+    saved = len(last) - len(failed)
+    print(f'Saved {saved} of {len(last)} trucks')
+
+    return {
+        # 207 when only some of the trucks were saved
+        'statusCode': 200 if not failed else 207,
+        'body': json.dumps({
+            'message': f'{saved} of {len(last)} trucks saved',
+            'results': results
+        })
+    }
+
+
 def lambda_handler(event, context):
+    if event.get('resource') == '/addtrucks':
+        return add_trucks(event)
+
     try:
         payload = json.loads(event['body'])
         print(f'Received payload: {payload}')
@@ -14,6 +116,7 @@ def lambda_handler(event, context):
         # Get the DynamoDB table and put the item in the table
         table = dynamodb.Table(TABLE_NAME)
         table.put_item(Item=payload)
+        flush_cache(event)
 
         # Return a success response
         response = {
@@ -1,4 +1,5 @@
 from aws_cdk import (
+    Duration,
     Stack,
     aws_apigateway as apigw,
     aws_iam as iam,
@@ -7,30 +8,128 @@ from aws_cdk import (
     aws_dynamodb as dynamodb,
 )
 from constructs import Construct
-from models.post_truck_model import post_truck_schema
+from models.post_truck_model import post_truck_schema, post_trucks_schema, truck_properties
 
-with open("./templates/get_all_trucks.txt", "r", encoding="utf-8") as f:
-    get_all_trucks_template= f.read()
+with open("./templates/get_page.txt", "r", encoding="utf-8") as f:
+    get_page_template= f.read()
+
+with open("./templates/get_item.txt", "r", encoding="utf-8") as f:
+    get_item_template= f.read()
+
+# attributes the listing methods return, and the names accepted by fields=
+truck_attributes = list(truck_properties)
+record_attributes = truck_attributes + [
+    "filename", "data_filename", "date", "map", "fleet_map", "duplicate_of", "columnar",
+    "simplified_points", "points", "distance_m", "min_lat", "max_lat", "min_lon", "max_lon",
+    "min_ele", "max_ele", "start_time", "end_time", "duration_s",
+]
+summary_attributes = ["currentVin", "run_count", "first_date", "last_date", "latest_map", "latest_map_file"]
+
+# optional query parameters of the paginated methods
+page_parameters = {
+    "method.request.querystring.limit": False,
+    "method.request.querystring.cursor": False,
+    "method.request.querystring.fields": False,
+}
+# every page and projection is cached separately
+page_cache_key_parameters = list(page_parameters)
+
+
+def vtl_list(names):
+    return "[" + ", ".join(f'"{name}"' for name in names) + "]"
+
+
+def page_request_template(request, key_names, attribute_names, default_limit=100):
+    """
+    VTL request template for one page of a Scan or Query. The limit query
+    parameter (1 to 1000) becomes Limit, the cursor returned with the
+    previous page becomes ExclusiveStartKey. The cursor is a base64 encoded
+    LastEvaluatedKey, only its key attributes are copied into the request.
+    The comma separated fields query parameter becomes ProjectionExpression,
+    names that are not in attribute_names are ignored.
+    """
+    names = request.pop("ExpressionAttributeNames", {})
+    start_key = ", ".join(
+        f'"{name}": {{"S": "$util.escapeJavaScript($key.{name}.S)"}}' for name in key_names
+    )
+    projection_names = "".join(f'"{name}": "{value}", ' for name, value in names.items())
+    return (
+        "#set($limit = $input.params('limit'))\n"
+        "#set($cursor = $input.params('cursor'))\n"
+        "#set($allowed = " + vtl_list(attribute_names) + ")\n"
+        "#set($projection = [])\n"
+        "#foreach($field in $input.params('fields').split(','))\n"
+        "#if($allowed.contains($field.trim()) && !$projection.contains($field.trim()))#set($added = $projection.add($field.trim()))#end\n"
+        "#end\n"
+        + repr(request).replace("'", '"')[:-1] + ",\n"
+        + '"Limit": #if($limit.matches("^([1-9][0-9]{0,2}|1000)$"))$limit#{else}' + str(default_limit) + "#end\n"
+        + "#if($cursor != \"\")\n"
+        + "#set($key = $util.parseJson($util.base64Decode($cursor)))\n"
+        + ', "ExclusiveStartKey": {' + start_key + "}\n"
+        + "#end\n"
+        + "#if($projection.size() > 0)\n"
+        + ', "ProjectionExpression": "#foreach($field in $projection)#f$foreach.index#if($foreach.hasNext), #end#end"\n'
+        + ', "ExpressionAttributeNames": {' + projection_names
+        + '#foreach($field in $projection)"#f$foreach.index": "$field"#if($foreach.hasNext), #end#end}\n'
+        + ("#else\n, \"ExpressionAttributeNames\": " + repr(names).replace("'", '"') + "\n" if names else "")
+        + "#end\n"
+        + "}"
+    )
+
+
+def page_response_template(attribute_names):
+    """VTL response template of a page with the attributes of every item that are in attribute_names."""
+    return "#set($attributes = " + vtl_list(attribute_names) + ")\n" + get_page_template
+
+
+def item_response_template(attribute_names):
+    """VTL response template of a GetItem, the attributes of the item that are in attribute_names or a 404."""
+    return "#set($attributes = " + vtl_list(attribute_names) + ")\n" + get_item_template
 
-with open("./templates/get_all_records.txt", "r", encoding="utf-8") as f:
-    get_all_records_template= f.read()
 
 class RestApiGWStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, 
                 user_pool: cognito.UserPool, 
                 add_truck_lambda: _lambda.Function, 
+                geo_query_lambda: _lambda.Function,
                 trucks_table: dynamodb.Table, 
                 records_table: dynamodb.Table, 
+                vin_date_index_name: str,
+                vin_summary_table: dynamodb.Table,
+                trucks_cache_ttl: Duration = Duration.hours(1),
+                records_cache_ttl: Duration = Duration.minutes(1),
                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # Stage throttle, also for the cached reads: a client can miss the cache
+        # with any other cursor, limit or fields, and misses scan the tables
+        rate_limit = 10
+        burst_limit = 2
+
+        # The trucks are cached longer, EnterTruckLambda flushes the cache when
+        # it writes a truck
+        def cached_read(ttl):
+            return apigw.MethodDeploymentOptions(
+                caching_enabled=True,
+                cache_ttl=ttl,
+                throttling_rate_limit=rate_limit,
+                throttling_burst_limit=burst_limit
+            )
+
         rest_api = apigw.RestApi(
             self,
             "RunlogRestApi",
             deploy_options=apigw.StageOptions(
-                throttling_rate_limit=10,
-                throttling_burst_limit=2
+                throttling_rate_limit=rate_limit,
+                throttling_burst_limit=burst_limit,
+                cache_cluster_enabled=True,
+                cache_cluster_size="0.5",
+                method_options={
+                    "/alltrucks/GET": cached_read(trucks_cache_ttl),
+                    "/allrecords/GET": cached_read(records_cache_ttl),
+                    "/records/GET": cached_read(records_cache_ttl),
+                }
             )
         )
 
@@ -73,12 +172,48 @@ class RestApiGWStack(Stack):
             ),
         )
 
+        post_trucks_model = rest_api.add_model("AddTrucksModel",
+            content_type="application/json",
+            model_name="PostTrucksRequestModel",
+            schema=post_trucks_schema
+        )
+
+        body_validator = rest_api.add_request_validator("BodyValidator",
+            request_validator_name="BodyValidator",
+            validate_request_body=True,
+            validate_request_parameters=False
+        )
+
+        # bulk registration of up to 500 trucks, answered with the result of every truck
+        add_trucks = rest_api.root.add_resource("addtrucks")
+
+        add_trucks.add_method(
+            "POST",
+            apigw.LambdaIntegration(add_truck_lambda),
+            authorizer=rest_auth,
+            authorization_type=apigw.AuthorizationType.COGNITO,
+            request_models={
+                "application/json": post_trucks_model
+            },
+            request_validator=body_validator,
+        )
+
         ddb_scan_policy = iam.PolicyDocument(
             statements=[
                 iam.PolicyStatement(
                     actions=["dynamodb:Scan"],
                     resources=[f"{trucks_table.table_arn}", f"{records_table.table_arn}"],
                     effect=iam.Effect.ALLOW
+                ),
+                iam.PolicyStatement(
+                    actions=["dynamodb:Query"],
+                    resources=[f"{records_table.table_arn}/index/{vin_date_index_name}"],
+                    effect=iam.Effect.ALLOW
+                ),
+                iam.PolicyStatement(
+                    actions=["dynamodb:GetItem"],
+                    resources=[vin_summary_table.table_arn],
+                    effect=iam.Effect.ALLOW
                 )
             ]
         )
@@ -97,14 +232,15 @@ class RestApiGWStack(Stack):
             integration_http_method="POST",
             options=apigw.IntegrationOptions(
                 credentials_role=ddb_scan_role,
+                cache_key_parameters=page_cache_key_parameters,
                 request_templates={
-                    "application/json": repr({"TableName": trucks_table.table_name}).replace("'", '"')
+                    "application/json": page_request_template({"TableName": trucks_table.table_name}, ["currentVin"], truck_attributes)
                 },
                 integration_responses=[
                     apigw.IntegrationResponse(
                         status_code="200",
                         response_templates={
-                            "application/json": get_all_trucks_template
+                            "application/json": page_response_template(truck_attributes)
                         }
                     )
                 ],
@@ -118,6 +254,7 @@ class RestApiGWStack(Stack):
             get_all_trucks,
             authorization_type=apigw.AuthorizationType.COGNITO,
             authorizer=rest_auth,
+            request_parameters=page_parameters,
             method_responses=[
                 apigw.MethodResponse(
                     status_code="200",
@@ -131,14 +268,15 @@ class RestApiGWStack(Stack):
             integration_http_method="POST",
             options=apigw.IntegrationOptions(
                 credentials_role=ddb_scan_role,
+                cache_key_parameters=page_cache_key_parameters,
                 request_templates={
-                    "application/json": repr({"TableName": records_table.table_name}).replace("'", '"')
+                    "application/json": page_request_template({"TableName": records_table.table_name}, ["filename"], record_attributes)
                 },
                 integration_responses=[
                     apigw.IntegrationResponse(
                         status_code="200",
                         response_templates={
-                            "application/json": get_all_records_template
+                            "application/json": page_response_template(record_attributes)
                         }
                     )
                 ],
@@ -152,9 +290,136 @@ class RestApiGWStack(Stack):
             get_all_records,
             authorization_type=apigw.AuthorizationType.COGNITO,
             authorizer=rest_auth,
+            request_parameters=page_parameters,
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                )
+            ]
+        )
+
+        query_validator = rest_api.add_request_validator("QueryParametersValidator",
+            request_validator_name="QueryParametersValidator",
+            validate_request_parameters=True
+        )
+
+        # runs whose tracks pass through a box, e.g.
+        # /runsnear?min_lat=46.70&min_lon=-121.14&max_lat=46.80&max_lon=-121.06
+        runs_near = rest_api.root.add_resource("runsnear")
+
+        runs_near.add_method("GET",
+            apigw.LambdaIntegration(geo_query_lambda),
+            authorization_type=apigw.AuthorizationType.COGNITO,
+            authorizer=rest_auth,
+            request_parameters={
+                "method.request.querystring.min_lat": True,
+                "method.request.querystring.min_lon": True,
+                "method.request.querystring.max_lat": True,
+                "method.request.querystring.max_lon": True,
+            },
+            request_validator=query_validator,
+        )
+
+        # runs of a truck between two dates, e.g. /records?vin=E94821&from=2023-04-01&to=2023-04-30
+        # from and to are optional and inclusive, dates are YYYY-MM-DD
+        get_vin_records = apigw.AwsIntegration(
+            service="dynamodb",
+            action="Query",
+            integration_http_method="POST",
+            options=apigw.IntegrationOptions(
+                credentials_role=ddb_scan_role,
+                cache_key_parameters=[
+                    "method.request.querystring.vin",
+                    "method.request.querystring.from",
+                    "method.request.querystring.to",
+                    *page_cache_key_parameters
+                ],
+                request_templates={
+                    "application/json": page_request_template({
+                        "TableName": records_table.table_name,
+                        "IndexName": vin_date_index_name,
+                        "KeyConditionExpression": "currentVin = :vin AND #date BETWEEN :from AND :to",
+                        "ExpressionAttributeNames": {"#date": "date"},
+                        "ExpressionAttributeValues": {
+                            ":vin": {"S": "$util.escapeJavaScript($input.params('vin'))"},
+                            ":from": {"S": "#if($input.params('from') != '')$util.escapeJavaScript($input.params('from'))#{else}0000-01-01#end"},
+                            ":to": {"S": "#if($input.params('to') != '')$util.escapeJavaScript($input.params('to'))#{else}9999-12-31#end"}
+                        }
+                    }, ["filename", "currentVin", "date"], record_attributes)
+                },
+                integration_responses=[
+                    apigw.IntegrationResponse(
+                        status_code="200",
+                        response_templates={
+                            "application/json": page_response_template(record_attributes)
+                        }
+                    )
+                ],
+                passthrough_behavior=apigw.PassthroughBehavior.WHEN_NO_TEMPLATES,
+            )
+        )
+
+        vin_records = rest_api.root.add_resource("records")
+
+        vin_records.add_method("GET",
+            get_vin_records,
+            authorization_type=apigw.AuthorizationType.COGNITO,
+            authorizer=rest_auth,
+            request_parameters={
+                "method.request.querystring.vin": True,
+                "method.request.querystring.from": False,
+                "method.request.querystring.to": False,
+                **page_parameters
+            },
+            request_validator=query_validator,
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                )
+            ]
+        )
+
+        # run count, first and last date and latest map of a truck, e.g. /trucks/E94821/summary
+        get_vin_summary = apigw.AwsIntegration(
+            service="dynamodb",
+            action="GetItem",
+            integration_http_method="POST",
+            options=apigw.IntegrationOptions(
+                credentials_role=ddb_scan_role,
+                request_templates={
+                    "application/json": repr({
+                        "TableName": vin_summary_table.table_name,
+                        "Key": {
+                            "currentVin": {
+                                "S": "$util.escapeJavaScript($input.params('vin'))"
+                            }
+                        }
+                    }).replace("'", '"')
+                },
+                integration_responses=[
+                    apigw.IntegrationResponse(
+                        status_code="200",
+                        response_templates={
+                            "application/json": item_response_template(summary_attributes)
+                        }
+                    )
+                ],
+                passthrough_behavior=apigw.PassthroughBehavior.WHEN_NO_TEMPLATES,
+            )
+        )
+
+        vin_summary = rest_api.root.add_resource("trucks").add_resource("{vin}").add_resource("summary")
+
+        vin_summary.add_method("GET",
+            get_vin_summary,
+            authorization_type=apigw.AuthorizationType.COGNITO,
+            authorizer=rest_auth,
             method_responses=[
                 apigw.MethodResponse(
                     status_code="200",
+                ),
+                apigw.MethodResponse(
+                    status_code="404",
                 )
             ]
         )
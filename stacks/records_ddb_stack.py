@@ -6,6 +6,7 @@ from aws_cdk import (
     aws_s3 as s3,
     aws_s3_notifications as s3n,
     aws_lambda as _lambda,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_dynamodb as dynamodb,
     aws_sqs as sqs,
     aws_iam as iam
@@ -16,9 +17,6 @@ from constructs import Construct
 incomingcsv_bucket_name = "incomingcsvs-" + str(uuid.uuid4())
 maps_bucket_name = "maps-" + str(uuid.uuid4())
 
-with open("./templates/get_all_records.txt", "r", encoding="utf-8") as f:
-    get_all_records_template= f.read()
-
 
 class RecordsDdbStack(Stack):
     """
@@ -26,7 +24,26 @@ class RecordsDdbStack(Stack):
     a Lambda function to put test records in the table.
     """
     
-    def __init__(self, scope: Construct, id: str, trucks_table: dynamodb.Table, **kwargs) -> None:
+    def __init__(self, scope: Construct, id: str, trucks_table: dynamodb.Table,
+                 ingest_mode: str = "batch",
+                 truck_cache_ttl: int = 300,
+                 maps_batch_size: int = 10,
+                 maps_batching_window: Duration = Duration.seconds(5),
+                 maps_parallelization_factor: int = 1,
+                 columnar_format: str = "parquet",
+                 geohash_precision: int = 6,
+                 fleet_maps: bool = True,
+                 maps_memory_size: int = 2048,
+                 maps_timeout: Duration = Duration.minutes(10),
+                 fanout_bytes: int = 64 * 1024 * 1024,
+                 fanout_chunk_bytes: int = None,
+                 fanout_workers: int = 8,
+                 chunk_memory_size: int = 1024,
+                 chunk_timeout: Duration = Duration.minutes(2),
+                 csv_cache_bytes: int = 256 * 1024 * 1024,
+                 viewer_origins: tuple = ("*",),
+                 summary_batch_size: int = 100,
+                 **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
 
@@ -55,6 +72,16 @@ class RecordsDdbStack(Stack):
             bucket_name=maps_bucket_name,
             public_read_access=False,
             enforce_ssl=True,
+            # viewer.html fetches the routes, manifests and chunks with presigned URLs
+            cors=[s3.CorsRule(
+                allowed_methods=[s3.HttpMethods.GET, s3.HttpMethods.HEAD],
+                allowed_origins=list(viewer_origins),
+                allowed_headers=["*"],
+                max_age=3000
+            )],
+            # chunk summaries too large for an invoke response, deleted by the
+            # coordinator once read, and expired when it failed before that
+            lifecycle_rules=[s3.LifecycleRule(prefix="fanout/", expiration=Duration.days(1))],
         )
 
         self.records_table = dynamodb.Table(
@@ -64,9 +91,58 @@ class RecordsDdbStack(Stack):
                 name='filename',
                 type=dynamodb.AttributeType.STRING
             ), 
-            stream=dynamodb.StreamViewType.NEW_IMAGE
+            # the old image has the VIN of a removed record for SummaryLambda
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES
+        )
+
+        # Runs of a truck between two dates, queried by the /records API
+        self.vin_date_index_name = "VinDateIndex"
+        self.records_table.add_global_secondary_index(
+            index_name=self.vin_date_index_name,
+            partition_key=dynamodb.Attribute(
+                name='currentVin',
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name='date',
+                type=dynamodb.AttributeType.STRING
+            )
+        )
+
+        # Runs indexed by the geohash cells their tracks pass through.
+        # The partition key is a 3 character prefix of the cell, the sort key
+        # starts with the full cell, so a query box of any size down to the
+        # indexed precision is answered with begins_with queries.
+        geo_index_table = dynamodb.Table(
+            self,
+            'RunsGeoIndexTable',
+            partition_key=dynamodb.Attribute(
+                name='cell_prefix',
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name='cell_run',
+                type=dynamodb.AttributeType.STRING
+            )
         )
 
+        # Record attributes and geohash cells of every distinct CSV content,
+        # so that duplicate uploads reuse the map of the first one
+        map_cache_table = dynamodb.Table(
+            self,
+            'MapCacheTable',
+            partition_key=dynamodb.Attribute(
+                name='content_key',
+                type=dynamodb.AttributeType.STRING
+            )
+        )
+
+        geohash_environment = {
+            'GEO_INDEX_TABLE': geo_index_table.table_name,
+            'GEOHASH_PRECISION': str(geohash_precision),
+            'GEOHASH_PREFIX_PRECISION': '3'
+        }
+
         # Define the Lambda function
         self.csv_lambda = _lambda.Function(
             self, "CsvLambda",
@@ -75,7 +151,10 @@ class RecordsDdbStack(Stack):
             code=_lambda.Code.from_asset("./lambdas/csv_lambda"),
             environment={
                 'TRUCKS_TABLE_NAME': trucks_table.table_name,
-                'RECORDS_TABLE_NAME': self.records_table.table_name
+                'RECORDS_TABLE_NAME': self.records_table.table_name,
+                # "batch" or "conditional", see lambdas/csv_lambda/index.py
+                'INGEST_MODE': ingest_mode,
+                'TRUCK_CACHE_TTL': str(truck_cache_ttl)
             }
         )
 
@@ -98,7 +177,7 @@ class RecordsDdbStack(Stack):
             s3.NotificationKeyFilter(suffix="_PQR.csv")
         )
 
-        # create lambd layer with Pandas and Folium
+        # create lambd layer with Pandas, Folium and PyArrow
         maps_lambda_layer = _lambda.LayerVersion(
             self, "MapsLambdaLayer",
             code=_lambda.Code.from_asset("./lambda_layers/maps_layer.zip"),
@@ -107,6 +186,48 @@ class RecordsDdbStack(Stack):
 
         dlq = sqs.Queue(self, "MapsLambdaDlq", queue_name="MapsLambdaDlq")
 
+        # A pandas parse peaks at about 6 times the CSV bytes, on top of the
+        # imported libraries, so a chunk takes a sixteenth of the chunk memory
+        if fanout_chunk_bytes is None:
+            fanout_chunk_bytes = chunk_memory_size * 1024 * 1024 // 16
+
+        # The chunks of large files are parsed by a function of their own, so
+        # the coordinator can wait for them with a longer timeout
+        chunk_lambda = _lambda.Function(
+            self, "MapsChunkLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="index.lambda_handler",
+            code=_lambda.Code.from_asset("./lambdas/maps_lambda"),
+            layers=[maps_lambda_layer],
+            environment={
+                'CSV_BUCKET': csv_bucket.bucket_name,
+                'MAPS_BUCKET': maps_bucket.bucket_name,
+                **geohash_environment
+            },
+            memory_size=chunk_memory_size,
+            timeout=chunk_timeout,
+            retry_attempts=0
+        )
+
+        logs.LogGroup(
+            self,
+            'MapsChunkLambdaLogGroup',
+            log_group_name=f'/aws/lambda/{chunk_lambda.function_name}',
+            retention=logs.RetentionDays.ONE_DAY
+        )
+
+        csv_bucket.grant_read(chunk_lambda)
+        maps_bucket.grant_put(chunk_lambda, "fanout/*")
+
+        # Maps of a batch are generated in parallel, as many as fit in the
+        # memory of the function next to the imported libraries when every
+        # file is as large as a file that is not split into chunks
+        if fanout_bytes:
+            map_workers = (maps_memory_size - 256) * 1024 * 1024 // (6 * fanout_bytes)
+        else:
+            map_workers = 1
+        map_workers = max(1, min(maps_batch_size, 4, map_workers))
+
         # Create a Lambda function for generating maps
         maps_lambda = _lambda.Function(
             self, "MapsLambda",
@@ -117,9 +238,27 @@ class RecordsDdbStack(Stack):
             environment={
                 'CSV_BUCKET': csv_bucket.bucket_name,
                 'MAPS_BUCKET': maps_bucket.bucket_name,
-                'RECORDS_TABLE': self.records_table.table_name
+                'RECORDS_TABLE': self.records_table.table_name,
+                'MAP_WORKERS': str(map_workers),
+                # "parquet", "arrow" or "" to skip the columnar sidecar files
+                'COLUMNAR_FORMAT': columnar_format,
+                'MAP_CACHE_TABLE': map_cache_table.table_name,
+                # per VIN file with the routes of all runs, see lambdas/maps_lambda/fleet.py
+                'FLEET_MAPS': 'true' if fleet_maps else 'false',
+                # larger CSV files are split into chunks processed by invocations of the function itself,
+                # at most fanout_workers of them at a time
+                'FANOUT_BYTES': str(fanout_bytes),
+                'FANOUT_CHUNK_BYTES': str(fanout_chunk_bytes),
+                'FANOUT_WORKERS': str(fanout_workers),
+                'CHUNK_FUNCTION': chunk_lambda.function_name,
+                # CSV files kept in /tmp across warm invocations, downloads in progress included,
+                # within the default 512 MB
+                'CSV_CACHE_BYTES': str(csv_cache_bytes),
+                **geohash_environment
             },
-            timeout=Duration.minutes(2),
+            memory_size=maps_memory_size,
+            # longer than chunk_timeout, the coordinator of a large file waits for its chunks
+            timeout=maps_timeout,
             retry_attempts=0,
             dead_letter_queue_enabled=True,
             dead_letter_queue=dlq
@@ -137,14 +276,25 @@ class RecordsDdbStack(Stack):
         self.records_table.grant_stream_read(maps_lambda)
         self.records_table.grant_write_data(maps_lambda)
         csv_bucket.grant_read(maps_lambda)
-        maps_bucket.grant_write(maps_lambda)
+        # read access for the fleet files that are updated in place, and for the viewer check
+        maps_bucket.grant_read_write(maps_lambda)
+        geo_index_table.grant_write_data(maps_lambda)
+        map_cache_table.grant_read_write_data(maps_lambda)
+
+        chunk_lambda.grant_invoke(maps_lambda)
 
         # Add a stream event source mapping to the Lambda function
         maps_lambda.add_event_source_mapping(
             "MapsLambdaEventSourceMapping",
             event_source_arn=self.records_table.table_stream_arn,
             starting_position=_lambda.StartingPosition.LATEST,
-            batch_size=1,
+            batch_size=maps_batch_size,
+            max_batching_window=maps_batching_window,
+            parallelization_factor=maps_parallelization_factor,
+            # the handler returns the records it could not process
+            report_batch_item_failures=True,
+            retry_attempts=2,
+            on_failure=lambda_event_sources.SqsDlq(dlq),
             filters=[_lambda.FilterCriteria.filter(
                 {
                     "eventName": _lambda.FilterRule.is_equal("INSERT")
@@ -153,6 +303,88 @@ class RecordsDdbStack(Stack):
             ]
         )
 
+        # Create a Lambda function for the runs near a location API
+        self.geo_query_lambda = _lambda.Function(
+            self, "GeoQueryLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="index.lambda_handler",
+            code=_lambda.Code.from_asset("./lambdas/geo_lambda"),
+            environment=geohash_environment,
+            timeout=Duration.seconds(29)
+        )
+
+        logs.LogGroup(
+            self,
+            'GeoQueryLambdaLogGroup',
+            log_group_name=f'/aws/lambda/{self.geo_query_lambda.function_name}',
+            retention=logs.RetentionDays.ONE_DAY
+        )
+
+        geo_index_table.grant_read_data(self.geo_query_lambda)
+
+        # Run count, first and last date and latest map of every VIN,
+        # kept current from the RecordsTable stream by SummaryLambda
+        self.vin_summary_table = dynamodb.Table(
+            self,
+            'VinSummaryTable',
+            partition_key=dynamodb.Attribute(
+                name='currentVin',
+                type=dynamodb.AttributeType.STRING
+            )
+        )
+
+        summary_lambda = _lambda.Function(
+            self, "SummaryLambda",
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler="index.lambda_handler",
+            code=_lambda.Code.from_asset("./lambdas/summary_lambda"),
+            environment={
+                'RECORDS_TABLE': self.records_table.table_name,
+                'VIN_DATE_INDEX': self.vin_date_index_name,
+                'VIN_SUMMARY_TABLE': self.vin_summary_table.table_name
+            },
+            timeout=Duration.minutes(1)
+        )
+
+        logs.LogGroup(
+            self,
+            'SummaryLambdaLogGroup',
+            log_group_name=f'/aws/lambda/{summary_lambda.function_name}',
+            retention=logs.RetentionDays.ONE_DAY
+        )
+
+        self.records_table.grant_stream_read(summary_lambda)
+        self.records_table.grant_read_data(summary_lambda)
+        self.vin_summary_table.grant_read_write_data(summary_lambda)
+
+        summary_dlq = sqs.Queue(self, "SummaryLambdaDlq", queue_name="SummaryLambdaDlq")
+
+        # Inserted and removed records, and the updates that add a map.
+        # The handler applies the batch in order and returns the records
+        # from the first one it could not apply.
+        summary_lambda.add_event_source_mapping(
+            "SummaryLambdaEventSourceMapping",
+            event_source_arn=self.records_table.table_stream_arn,
+            starting_position=_lambda.StartingPosition.LATEST,
+            batch_size=summary_batch_size,
+            report_batch_item_failures=True,
+            retry_attempts=5,
+            on_failure=lambda_event_sources.SqsDlq(summary_dlq),
+            filters=[
+                _lambda.FilterCriteria.filter(
+                    {
+                        "eventName": _lambda.FilterRule.or_("INSERT", "REMOVE")
+                    }
+                ),
+                _lambda.FilterCriteria.filter(
+                    {
+                        "eventName": _lambda.FilterRule.is_equal("MODIFY"),
+                        "dynamodb": {"NewImage": {"map": {"S": _lambda.FilterRule.exists()}}}
+                    }
+                )
+            ]
+        )
+
         # create output of bucket name
         CfnOutput(self, "CsvBucketName", value=csv_bucket.bucket_name)
         CfnOutput(self, "MapsBucketName", value=maps_bucket.bucket_name)
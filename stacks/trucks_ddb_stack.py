@@ -1,5 +1,6 @@
 from aws_cdk import (
     CfnOutput,
+    Duration,
     Stack,
     aws_dynamodb as dynamodb,
     aws_lambda as _lambda,
@@ -47,6 +48,8 @@ class TrucksDdbStack(Stack):
             handler='index.lambda_handler',
             code=_lambda.Code.from_asset('./lambdas/trucksdb_lambda'),
             role=lambda_role,
+            # bulk requests write up to 500 trucks, within the API Gateway timeout
+            timeout=Duration.seconds(29),
             # reserved_concurrent_executions=1,
             environment={
                 'TRUCKS_TABLE_NAME': self.trucks_table.table_name,
@@ -57,6 +60,13 @@ class TrucksDdbStack(Stack):
         # Grant write access to the DynamoDB table to the Lambda function
         self.trucks_table.grant_write_data(lambda_role)
 
+        # The Lambda function flushes the cached GET /alltrucks responses of
+        # the stage it was called from after a write
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            actions=['apigateway:DELETE'],
+            resources=[f'arn:aws:apigateway:{self.region}::/restapis/*/stages/*/cache/data']
+        ))
+
         logs.LogGroup(
             self,
             'EnterTruckLambdaLogGroup',